@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# ---------------- Configuration ------------------
+PROMPT = "You are Lulu, an intelligent AI assistant working at Airtel Kenya.\nHuman: How do I top up an agent's float?\nAssistant:"
+SENTENCES = [
+    "How do I approve a pending KYC registration?",
+    "The agent's float transfer failed with insufficient balance.",
+    "Where is the nearest Airtel shop in Kakamega?",
+    "What documents are needed to onboard a new agent?",
+] * 16
+
+def _rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak, in KB on Linux
+
+# ---------------- One Backend (runs in a fresh process) ------------------
+def measure(text_backend, embed_backend, new_tokens, runs):
+    import torch
+    from lulu_models import build_llm, configure_threads, load_embedder, load_text_model
+
+    configure_threads()
+    baseline = _rss_mb()
+    started = time.perf_counter()
+    model, tokenizer = load_text_model(text_backend)
+    build_llm(model, tokenizer)
+    text_load = time.perf_counter() - started
+    started = time.perf_counter()
+    embedder = load_embedder(embed_backend)
+    embed_load = time.perf_counter() - started
+
+    inputs = tokenizer(PROMPT, return_tensors="pt")
+    generate = dict(max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False,
+                    pad_token_id=tokenizer.eos_token_id)
+    with torch.no_grad():
+        model.generate(**inputs, **generate)  # warm-up
+        started = time.perf_counter()
+        for _ in range(runs):
+            model.generate(**inputs, **generate)
+        generate_time = (time.perf_counter() - started) / runs
+
+    embedder.embed_documents(SENTENCES[:4])  # warm-up
+    started = time.perf_counter()
+    for _ in range(runs):
+        embedder.embed_documents(SENTENCES)
+    embed_time = (time.perf_counter() - started) / runs
+
+    return {
+        "text": text_backend, "embed": embed_backend,
+        "text_load_s": round(text_load, 2), "embed_load_s": round(embed_load, 2),
+        "rss_mb": round(_rss_mb() - baseline, 1),
+        "tokens_per_s": round(new_tokens / generate_time, 1),
+        "sentences_per_s": round(len(SENTENCES) / embed_time, 1),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare Lulu's inference backends: load time, memory, throughput.")
+    parser.add_argument("--text", nargs="+", default=["torch", "int8"], help="Text backends to compare")
+    parser.add_argument("--embed", nargs="+", default=["torch", "onnx"], help="Embedding backends to compare")
+    parser.add_argument("--tokens", type=int, default=64, help="New tokens per generation")
+    parser.add_argument("--runs", type=int, default=3, help="Timed repetitions per measurement")
+    parser.add_argument("--child", nargs=2, metavar=("TEXT", "EMBED"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure(*args.child, args.tokens, args.runs)))
+        return
+
+    # A fresh interpreter per combination so load time and memory are not shared between backends
+    rows = []
+    for text_backend in args.text:
+        for embed_backend in args.embed:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", text_backend, embed_backend,
+                 "--tokens", str(args.tokens), "--runs", str(args.runs)],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            rows.append(json.loads(output.strip().splitlines()[-1]))
+
+    columns = list(rows[0])
+    print("  ".join(f"{c:>15}" for c in columns))
+    for row in rows:
+        print("  ".join(f"{row[c]!s:>15}" for c in columns))
+
+if __name__ == "__main__":
+    main()
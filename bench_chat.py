@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# ---------------- Configuration ------------------
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot.py")
+PERCENTILES = (50, 95, 99)
+TURN_TIMEOUT_SECONDS = 300
+
+# Replayed when no recording is given: short to long, mixing routed and open-ended turns
+DEFAULT_CONVERSATIONS = [
+    {"name": "single question", "turns": ["How do I approve a pending KYC registration?"]},
+    {"name": "shop lookups", "turns": [
+        "Where is the Kakamega shop?",
+        "Which shops are open on saturday at 11am?",
+        "Nearest shop to -1.2921, 36.8219",
+    ]},
+    {"name": "ticket follow-up", "turns": [
+        "Follow Up on Ticket",
+        "What is the status of ticket 3fa9c2d1?",
+        "Open tickets for agent 0712 345 678",
+        "Thanks. What should I tell the agent while they wait?",
+    ]},
+    {"name": "long working session", "turns": [
+        "Hello Lulu",
+        "An agent's float transfer failed with insufficient balance. What do I check first?",
+        "They topped up but it still fails.",
+        "How many leave days do I have left?",
+        "What documents are needed to onboard a new agent?",
+        "And for a SIM swap?",
+        "Where can I find the Eldoret shop?",
+        "How is commission calculated for new registrations?",
+        "Summarise the float steps again please.",
+        "What is the escalation path if KYC stays pending for two days?",
+        "Is my ticket escalated? It's 3fa9c2d1",
+        "Thank you, that's all.",
+    ]},
+]
+
+def percentiles(values):
+    import numpy as np
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+
+def load_conversations(path):
+    """JSONL of {"name": ..., "turns": [user messages]}."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def recorded_conversations(db_path, limit):
+    """The user side of the latest `limit` conversations in a chat history database (see chat_store.py)."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    sessions = conn.execute("""
+        SELECT session_id FROM chat_sessions ORDER BY last_message_at DESC LIMIT ?
+    """, (limit,)).fetchall()
+    conversations = []
+    for (session_id,) in sessions:
+        turns = [row[0] for row in conn.execute("""
+            SELECT content FROM chat_messages WHERE session_id = ? AND role = 'user' ORDER BY message_id
+        """, (session_id,))]
+        if turns:
+            conversations.append({"name": session_id, "turns": turns})
+    conn.close()
+    return conversations
+
+# ---------------- Replay ------------------
+def replay(conversation):
+    """Runs one conversation in a fresh app session; returns one record per turn."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_PATH, default_timeout=TURN_TIMEOUT_SECONDS).run()
+    tokenizer = app.session_state["memory"].tokenizer
+    records = []
+    for number, message in enumerate(conversation["turns"], start=1):
+        app.session_state["last_prompt"] = None
+        started = time.perf_counter()
+        app.chat_input[0].set_value(message).run()
+        latency = time.perf_counter() - started
+        prompt = app.session_state["last_prompt"] if "last_prompt" in app.session_state else None
+        timer = app.session_state["turn_timer"] if "turn_timer" in app.session_state else None
+        records.append({
+            "conversation": conversation["name"],
+            "turn": number,
+            "latency": latency,
+            "route": app.session_state["last_route"] if "last_route" in app.session_state else None,
+            "cached": bool(app.session_state["last_reply_cached"]) if "last_reply_cached" in app.session_state else False,
+            "prompt_tokens": len(tokenizer.encode(prompt)) if prompt else None,
+            "stages": dict(timer.stages) if timer else {},
+            "error": str(app.exception[0].value) if app.exception else None,
+        })
+    return records
+
+# ---------------- Report ------------------
+def summarise(records):
+    latencies = [r["latency"] for r in records]
+    prompt_tokens = [r["prompt_tokens"] for r in records if r["prompt_tokens"]]
+    stages = defaultdict(list)
+    for record in records:
+        for stage, seconds in record["stages"].items():
+            stages[stage].append(seconds)
+    by_route = defaultdict(list)
+    for record in records:
+        by_route["cache" if record["cached"] else record["route"] or "?"].append(record["latency"])
+    return {
+        "turns": len(records),
+        "errors": sum(1 for r in records if r["error"]),
+        "latency": percentiles(latencies),
+        "prompt_tokens": {**percentiles(prompt_tokens), "max": max(prompt_tokens) if prompt_tokens else None},
+        "stages": {stage: {**percentiles(values), "turns": len(values)} for stage, values in sorted(stages.items())},
+        "routes": {route: {**percentiles(values), "turns": len(values)} for route, values in sorted(by_route.items())},
+    }
+
+def _ms(value):
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+def print_report(summary):
+    header = "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES)
+    latency = summary["latency"]
+    print(f"{summary['turns']} turns, {summary['errors']} errors")
+    print(f"\n{'end to end':<14}{header}")
+    print(f"{'':<14}" + "".join(f"{_ms(latency[f'p{p}']):>10}" for p in PERCENTILES))
+    for title, rows in (("stage", summary["stages"]), ("route", summary["routes"])):
+        print(f"\n{title:<14}{header}{'turns':>8}")
+        for name, row in rows.items():
+            print(f"{name:<14}" + "".join(f"{_ms(row[f'p{p}']):>10}" for p in PERCENTILES) + f"{row['turns']:>8}")
+    tokens = summary["prompt_tokens"]
+    if tokens["max"]:
+        print(f"\nprompt tokens: p50 {tokens['p50']:.0f} · p95 {tokens['p95']:.0f} · max {tokens['max']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay conversations through the Lulu chatbot and report latency.")
+    parser.add_argument("--conversations", help="JSONL of {name, turns} to replay (default: a built-in set)")
+    parser.add_argument("--recorded", metavar="DB", help="Replay the user side of conversations saved in this database")
+    parser.add_argument("--limit", type=int, default=20, help="How many recorded conversations to replay")
+    parser.add_argument("--repeat", type=int, default=3, help="Times to replay the whole set")
+    parser.add_argument("--text-backend", default="stub", help="LULU_TEXT_BACKEND for the run (stub, torch, int8)")
+    parser.add_argument("--embed-backend", default="stub", help="LULU_EMBED_BACKEND for the run (stub, torch, onnx)")
+    parser.add_argument("--streaming", action="store_true", help="Stream replies (default: wait for the whole reply)")
+    parser.add_argument("--no-batching", action="store_true", help="Call the model directly instead of the batch worker")
+    parser.add_argument("--db", help="Database the app writes to (default: a throwaway temp file)")
+    parser.add_argument("--json", help="Also write the summary and every turn record to this file")
+    args = parser.parse_args(argv)
+
+    if args.recorded:
+        conversations = recorded_conversations(args.recorded, args.limit)
+    elif args.conversations:
+        conversations = load_conversations(args.conversations)
+    else:
+        conversations = DEFAULT_CONVERSATIONS
+
+    # The app reads these at import time, so they must be set before the first run
+    os.environ["LULU_TEXT_BACKEND"] = args.text_backend
+    os.environ["LULU_EMBED_BACKEND"] = args.embed_backend
+    os.environ["LULU_STREAMING"] = "1" if args.streaming else "0"
+    os.environ["LULU_BATCHING"] = "0" if args.no_batching else "1"
+    os.environ["CHANNEL_PARTNERS_DB"] = args.db or os.path.join(tempfile.mkdtemp(prefix="bench_chat_"), "bench.db")
+
+    # Warm-up: model loading and index building happen once per process, not per turn
+    replay({"name": "warm-up", "turns": ["Hello"]})
+
+    records = []
+    for _ in range(args.repeat):
+        for conversation in conversations:
+            records += replay(conversation)
+            print(f"  {conversation['name']}: {len(conversation['turns'])} turns", file=sys.stderr)
+
+    summary = summarise(records)
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "turns": records}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
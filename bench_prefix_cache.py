@@ -0,0 +1,69 @@
+import argparse
+import statistics
+import time
+
+# ---------------- Configuration ------------------
+CONTEXT = "Extract from the KYC manual: approve registrations within 24 hours once the ID and selfie match. " * 3
+TURN = "Human: An agent's float transfer failed with insufficient balance.\nAssistant: Check the float wallet and retry.\n"
+QUESTION = "What should I check next?"
+HISTORY_TURNS = (0, 2, 6)
+
+def _median_ms(fn, runs):
+    fn()  # warm-up
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+def measure(model, tokenizer, prefix_cache, prompt, runs):
+    """Median prompt-processing time (one forward over the prompt) and time to first token, without and with the prefix cache."""
+    import torch
+
+    full_ids = torch.tensor([tokenizer.encode(prompt)])
+    rest_ids = torch.tensor([prefix_cache.ids + prefix_cache.rest_ids(prompt)])
+    greedy = dict(max_new_tokens=1, do_sample=False, pad_token_id=tokenizer.eos_token_id)
+    with torch.no_grad():
+        return {
+            "prompt_tokens": full_ids.shape[1],
+            "same_tokens": full_ids.tolist() == rest_ids.tolist(),
+            "prefill_ms": _median_ms(lambda: model(full_ids), runs),
+            "cached_prefill_ms": _median_ms(
+                lambda: model(rest_ids[:, len(prefix_cache):], past_key_values=prefix_cache.past_for(1)), runs),
+            "first_token_ms": _median_ms(lambda: model.generate(full_ids, attention_mask=torch.ones_like(full_ids), **greedy), runs),
+            "cached_first_token_ms": _median_ms(lambda: model.generate(
+                rest_ids, attention_mask=torch.ones_like(rest_ids), past_key_values=prefix_cache.past_for(1), **greedy), runs),
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure prompt processing per turn with and without Lulu's cached persona prefix.")
+    parser.add_argument("--text", nargs="+", default=["torch", "int8"], help="Text backends to measure")
+    parser.add_argument("--runs", type=int, default=20, help="Timed repetitions per measurement")
+    args = parser.parse_args(argv)
+
+    from lulu_models import configure_threads, load_text_model
+    from lulu_prefix_cache import build_prefix_cache
+    from lulu_prompt import LULU_PREFIX, LULU_TEMPLATE
+
+    configure_threads()
+    columns = ["backend", "history", "prompt_tokens", "prefix_tokens", "prefill_ms", "cached_prefill_ms",
+               "first_token_ms", "cached_first_token_ms", "saved"]
+    print("  ".join(f"{c:>21}" for c in columns))
+    for backend in args.text:
+        model, tokenizer = load_text_model(backend)
+        prefix_cache = build_prefix_cache(model, tokenizer, LULU_PREFIX)
+        if prefix_cache is None:
+            print(f"{backend:>21}  (model keeps no KV cache; nothing to measure)")
+            continue
+        for turns in HISTORY_TURNS:
+            prompt = LULU_TEMPLATE.format(context=CONTEXT, chat_history=TURN * turns, input=QUESTION)
+            row = measure(model, tokenizer, prefix_cache, prompt, args.runs)
+            if not row.pop("same_tokens"):
+                print(f"warning: the prefix tokenises differently on its own ({backend}, {turns} turns)")
+            row.update(backend=backend, history=f"{turns} turns", prefix_tokens=len(prefix_cache),
+                       saved=f"{1 - row['cached_prefill_ms'] / row['prefill_ms']:.0%}")
+            print("  ".join(f"{row[c]:>21.2f}" if isinstance(row[c], float) else f"{row[c]!s:>21}" for c in columns))
+
+if __name__ == "__main__":
+    main()
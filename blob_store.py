@@ -0,0 +1,182 @@
+import argparse
+import base64
+import hashlib
+import os
+import tempfile
+from datetime import datetime, timedelta
+from PIL import Image
+from tickets import TIMESTAMP_FORMAT
+
+# ---------------- Configuration ------------------
+UPLOAD_ROOT = "uploads"
+CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZE = (160, 160)
+# Unreferenced blobs younger than this may belong to a ticket that is still being saved
+CLEANUP_GRACE = timedelta(hours=1)
+
+# ---------------- Content-Addressed Store ------------------
+class BlobStore:
+    """
+    Stores uploaded images once per unique content, under their SHA-256 digest:
+    uploads/blobs/ab/abcdef....png, with a JPEG thumbnail under uploads/thumbs/.
+    ticket_blobs is the index of what is stored; store_ticket_image consults it.
+    """
+
+    def __init__(self, root=UPLOAD_ROOT):
+        self.root = root
+
+    def blob_path(self, digest, ext):
+        return os.path.join(self.root, "blobs", digest[:2], f"{digest}{ext}")
+
+    def thumbnail_path(self, digest):
+        return os.path.join(self.root, "thumbs", digest[:2], f"{digest}.jpg")
+
+    def spool(self, stream):
+        """Streams `stream` to a temporary file while hashing it; returns (digest, tmp_path, size)."""
+        os.makedirs(self.root, exist_ok=True)
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    sha.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            self.delete(tmp_path)
+            raise
+        return sha.hexdigest(), tmp_path, size
+
+    def place(self, tmp_path, digest, filename=""):
+        """Moves a spooled file to its content address; returns the blob path."""
+        path = self.blob_path(digest, os.path.splitext(filename)[1].lower())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return path
+
+    def make_thumbnail(self, digest, path):
+        """Writes a small JPEG preview next to the blob store; returns its path or "" if the image is unreadable."""
+        thumb_path = self.thumbnail_path(digest)
+        if os.path.exists(thumb_path):
+            return thumb_path
+        try:
+            with Image.open(path) as img:
+                img.thumbnail(THUMBNAIL_SIZE)
+                os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+                img.convert("RGB").save(thumb_path, "JPEG", quality=70)
+        except OSError:
+            return ""
+        return thumb_path
+
+    def delete(self, *paths):
+        for path in paths:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+# ---------------- Reference Tracking ------------------
+def store_ticket_image(conn, store, stream, filename):
+    """
+    Stores an uploaded image and registers it in ticket_blobs. Returns the blob path
+    to save as the ticket's image_path; the ticket triggers keep refcount in step.
+
+    Call it inside the transaction that writes the ticket. The lookup is a write
+    (it refreshes created_at, restarting the cleanup grace period), so the blob row
+    is checked and claimed under the write lock cleanup_blobs also takes: a blob
+    is never reused while it is being deleted. Content already stored keeps the
+    path it was registered under, whatever the new upload's extension. A new
+    file is placed before the caller commits; if that transaction rolls back,
+    sweep_unregistered_files removes it once it is older than the grace period.
+    """
+    digest, tmp_path, size = store.spool(stream)
+    try:
+        now = datetime.now().strftime(TIMESTAMP_FORMAT)
+        known = conn.execute(
+            "UPDATE ticket_blobs SET created_at = ? WHERE digest = ? RETURNING path", (now, digest)
+        ).fetchone()
+        if known:
+            return known[0]
+        path = store.place(tmp_path, digest, filename)
+        thumb_path = store.make_thumbnail(digest, path)
+        conn.execute("""
+            INSERT INTO ticket_blobs (digest, path, thumbnail_path, size, refcount, created_at)
+            VALUES (?, ?, ?, ?, 0, ?)
+        """, (digest, path, thumb_path, size, now))
+        return path
+    finally:
+        store.delete(tmp_path)
+
+def thumbnail_data_uri(path):
+    """Inline data URI for a stored thumbnail so st.dataframe can show it; "" if unavailable."""
+    if not path or not os.path.exists(path):
+        return ""
+    with open(path, "rb") as f:
+        return "data:image/jpeg;base64," + base64.b64encode(f.read()).decode("ascii")
+
+def cleanup_blobs(conn, store, grace=CLEANUP_GRACE):
+    """Deletes blobs (and thumbnails) no ticket references any more. Returns the number removed."""
+    cutoff = (datetime.now() - grace).strftime(TIMESTAMP_FORMAT)
+    orphans = conn.execute(
+        "SELECT digest, path, thumbnail_path FROM ticket_blobs WHERE refcount <= 0 AND created_at < ?",
+        (cutoff,),
+    ).fetchall()
+    removed = 0
+    for digest, path, thumb_path in orphans:
+        with conn:
+            # Re-check under the write lock (a ticket may have claimed the blob meanwhile) and
+            # remove the files before committing, so store_ticket_image never sees a row whose
+            # file is about to go
+            deleted = conn.execute(
+                "DELETE FROM ticket_blobs WHERE digest = ? AND refcount <= 0 AND created_at < ?", (digest, cutoff)
+            ).rowcount
+            if deleted:
+                store.delete(path, thumb_path)
+                removed += 1
+    return removed + sweep_unregistered_files(conn, store, grace)
+
+def sweep_unregistered_files(conn, store, grace=CLEANUP_GRACE):
+    """
+    Deletes stored files that have no ticket_blobs row and are older than `grace`:
+    blobs and thumbnails placed by a ticket transaction that then rolled back, and
+    .part files of uploads that never finished. Returns the number of blobs removed.
+    """
+    cutoff = (datetime.now() - grace).timestamp()
+    removed = 0
+    for directory in ("blobs", "thumbs"):
+        for parent, _, names in os.walk(os.path.join(store.root, directory)):
+            for name in names:
+                path = os.path.join(parent, name)
+                digest = os.path.splitext(name)[0]
+                try:
+                    if os.path.getmtime(path) >= cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                # Check and delete under the write lock, like store_ticket_image claims a blob
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    row = conn.execute(
+                        "SELECT path, thumbnail_path FROM ticket_blobs WHERE digest = ?", (digest,)
+                    ).fetchone()
+                    if row is None or path not in row:
+                        store.delete(path)
+                        removed += directory == "blobs"
+    if os.path.isdir(store.root):
+        for name in os.listdir(store.root):
+            path = os.path.join(store.root, name)
+            if name.endswith(".part") and os.path.getmtime(path) < cutoff:
+                store.delete(path)
+    return removed
+
+if __name__ == "__main__":
+    from db import DB_PATH, Database
+
+    parser = argparse.ArgumentParser(description="Remove ticket images that no ticket references.")
+    parser.add_argument("--db", default=DB_PATH, help="Path to the SQLite database")
+    parser.add_argument("--root", default=UPLOAD_ROOT, help="Upload directory")
+    parser.add_argument("--grace-hours", type=float, default=CLEANUP_GRACE.total_seconds() / 3600)
+    args = parser.parse_args()
+
+    conn = Database(args.db).connection()
+    removed = cleanup_blobs(conn, BlobStore(args.root), timedelta(hours=args.grace_hours))
+    print(f"Removed {removed} unreferenced blobs.")
@@ -0,0 +1,119 @@
+import argparse
+import json
+import sys
+from datetime import datetime
+from tickets import TIMESTAMP_FORMAT
+
+# ---------------- Configuration ------------------
+MESSAGE_COLUMNS = ["message_id", "session_id", "user_id", "role", "content", "created_at"]
+SESSION_COLUMNS = ["session_id", "title", "started_at", "last_message_at", "message_count"]
+MESSAGE_PAGE_SIZE = 50
+SESSION_PAGE_SIZE = 10
+CHUNK_SIZE = 1000
+
+# ---------------- Writes ------------------
+def append_message(conn, user_id, session_id, role, content, created_at=None):
+    """
+    Appends one chat message and returns its message_id. The chat_sessions summary
+    row is created or bumped by the trigger from migration 10.
+    """
+    created_at = created_at or datetime.now().strftime(TIMESTAMP_FORMAT)
+    with conn:
+        return conn.execute("""
+            INSERT INTO chat_messages (session_id, user_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)
+        """, (session_id, user_id, role, content, created_at)).lastrowid
+
+# ---------------- Paginated Reads ------------------
+def list_sessions(conn, user_id, page_size=SESSION_PAGE_SIZE, before=None):
+    """
+    One page of a user's conversations, most recent first, as dicts. `before` is the
+    cursor returned for the previous page. Returns (sessions, next_cursor); the
+    cursor is None on the last page.
+    """
+    where, params = "WHERE user_id = ?", [user_id]
+    if before:
+        where += " AND (last_message_at, session_id) < (?, ?)"
+        params += list(before)
+    rows = conn.execute(f"""
+        SELECT {', '.join(SESSION_COLUMNS)} FROM chat_sessions
+        {where}
+        ORDER BY last_message_at DESC, session_id DESC
+        LIMIT ?
+    """, params + [page_size + 1]).fetchall()
+    sessions = [dict(zip(SESSION_COLUMNS, row)) for row in rows[:page_size]]
+    next_cursor = (sessions[-1]["last_message_at"], sessions[-1]["session_id"]) if len(rows) > page_size else None
+    return sessions, next_cursor
+
+def fetch_messages(conn, session_id, page_size=MESSAGE_PAGE_SIZE, before_id=None):
+    """
+    The `page_size` messages of a conversation just before message `before_id`
+    (default: the latest ones), oldest first, as dicts. Returns (messages, has_more).
+    """
+    where, params = "WHERE session_id = ?", [session_id]
+    if before_id is not None:
+        where += " AND message_id < ?"
+        params.append(before_id)
+    rows = conn.execute(f"""
+        SELECT {', '.join(MESSAGE_COLUMNS)} FROM chat_messages
+        {where}
+        ORDER BY message_id DESC
+        LIMIT ?
+    """, params + [page_size + 1]).fetchall()
+    messages = [dict(zip(MESSAGE_COLUMNS, row)) for row in reversed(rows[:page_size])]
+    return messages, len(rows) > page_size
+
+# ---------------- Streaming Export ------------------
+def export_messages(conn, stream, user_id=None, session_id=None, since=None, chunk_size=CHUNK_SIZE):
+    """
+    Writes matching messages to a text stream as JSONL in chronological order,
+    `chunk_size` rows at a time, so memory and time depend on the export only.
+    Returns the number of messages written.
+    """
+    clauses, params = [], []
+    for column, value in (("user_id", user_id), ("session_id", session_id)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cursor = conn.execute(f"""
+        SELECT {', '.join(MESSAGE_COLUMNS)} FROM chat_messages
+        {where}
+        ORDER BY {'created_at, ' if user_id and not session_id else ''}message_id
+    """, params)
+
+    written = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        stream.writelines(json.dumps(dict(zip(MESSAGE_COLUMNS, row))) + "\n" for row in rows)
+        written += len(rows)
+    return written
+
+# ---------------- CLI ------------------
+def main(argv=None):
+    from db import DB_PATH, Database
+
+    parser = argparse.ArgumentParser(description="Export Lulu chat history as JSONL.")
+    parser.add_argument("path", help="Output file ('-' for stdout)")
+    parser.add_argument("--db", default=DB_PATH, help="Path to the SQLite database")
+    parser.add_argument("--user", help="Only this user's messages")
+    parser.add_argument("--session", help="Only this conversation")
+    parser.add_argument("--since", help=f"Only messages at or after this time ({TIMESTAMP_FORMAT})")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    conn = Database(args.db).connection()
+    options = {"user_id": args.user, "session_id": args.session, "since": args.since, "chunk_size": args.chunk_size}
+    if args.path == "-":
+        written = export_messages(conn, sys.stdout, **options)
+    else:
+        with open(args.path, "w", encoding="utf-8") as f:
+            written = export_messages(conn, f, **options)
+    print(f"Exported {written} messages.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -4,58 +4,56 @@ from langchain_community.embeddings import HuggingFaceEmbeddings # Using Hugging
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from langchain.memory import ConversationBufferMemory, CombinedMemory
 from langchain_core.messages import SystemMessage
 from langchain.chains import ConversationChain
 from langchain.prompts import PromptTemplate
 from PyPDF2 import PdfReader
+import io
 import json
 import pandas as pd
 import re
+import os
 import datetime
+import uuid
+import functools
+from contextlib import nullcontext
 
 # Hugging Face imports
 import transformers
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from langchain_huggingface import HuggingFacePipeline # LangChain wrapper for Hugging Face pipelines
 from sentence_transformers import SentenceTransformer # Direct import for embeddings (used by HuggingFaceEmbeddings)
+from lulu_streaming import StreamingGeneration
+from knowledge_index import KNOWLEDGE_TOKEN_BUDGET, get_knowledge_index, KnowledgeMemory
+from shop_catalogue import get_catalogue_loader, get_shop_catalogue, parse_when
+from shop_search import get_shop_index
+from shop_geo import find_coordinates, get_shop_geo_index
+from lulu_cache import get_response_cache
+from lulu_memory import INPUT_TOKEN_BUDGET, TokenBudgetMemory, history_budget
+from lulu_models import load_models
+from lulu_batching import MAX_NEW_TOKENS, ServiceBusy, get_inference_service
+from lulu_prefix_cache import get_prefix_cache
+from lulu_prompt import LULU_PREFIX, LULU_TEMPLATE
+from db import get_connection, get_read_connection
+from chat_store import append_message, export_messages, fetch_messages, list_sessions
+from lulu_router import FALLBACK_INTENT, get_intent_router
+from ticket_lookup import agent_tickets_reply, find_ticket_references, ticket_status_reply
+from lulu_responses import StageTimer, extract_reply, parse_thoughts
+
+# Stream tokens into the chat as they are generated (can be toggled per session in the UI)
+STREAM_RESPONSES = os.getenv("LULU_STREAMING", "1") == "1"
+# Route generation through the shared micro-batching worker instead of each session calling the model
+BATCH_INFERENCE = os.getenv("LULU_BATCHING", "1") == "1"
 
 # --- Model & Memory Setup ---
 @st.cache_resource
 def init_llm_and_memory():
-    # Define Hugging Face models to be used
-    # Updated to 'gpt2' for text generation to reduce memory footprint
-    TEXT_MODEL_HF = "gpt2" # Optimal and resource-friendly text generation model
-    EMBED_MODEL_HF = "sentence-transformers/all-MiniLM-L6-v2" # Optimal and resource-friendly embedding model
-
-    llm_instance = None # Use a different name to avoid confusion with global 'llm'
-    embedder_instance = None # Use a different name
-
+    # gpt2 for text generation and all-MiniLM-L6-v2 for embeddings; the backends
+    # (fp32/int8, torch/onnx), thread count and local model directory come from
+    # LULU_TEXT_BACKEND, LULU_EMBED_BACKEND, LULU_THREADS and LULU_MODEL_DIR
     try:
-        # Load tokenizer and model for text generation
-        text_tokenizer = AutoTokenizer.from_pretrained(TEXT_MODEL_HF)
-        text_model = AutoModelForCausalLM.from_pretrained(TEXT_MODEL_HF)
-
-        # Create a Hugging Face pipeline for text generation
-        hf_pipeline = transformers.pipeline(
-            "text-generation",
-            model=text_model, # Use the text_model
-            tokenizer=text_tokenizer, # Use the text_tokenizer
-            max_new_tokens=200, # Limit output length to prevent very long responses
-            do_sample=True,
-            temperature=0.7,
-            # For gpt2, pad_token_id is usually not an issue, but setting it explicitly is good practice
-            pad_token_id=text_tokenizer.eos_token_id 
-        )
-        # Wrap the Hugging Face pipeline with LangChain's HuggingFacePipeline
-        llm_instance = HuggingFacePipeline(pipeline=hf_pipeline)
-        #st.success(f"Text generation model {TEXT_MODEL_HF} loaded successfully.")
-
-        # Initialize Hugging Face embeddings
-        # HuggingFaceEmbeddings handles the SentenceTransformer loading internally
-        embedder_instance = HuggingFaceEmbeddings(model_name=EMBED_MODEL_HF)
-        #st.success(f"Embedding model {EMBED_MODEL_HF} loaded successfully.")
-        
+        llm_instance, embedder_instance = load_models()
     except Exception as e:
         st.error(f"An error occurred during Hugging Face model loading: {e}")
         st.stop() # Stop execution if models cannot be loaded
@@ -67,25 +65,26 @@ llm, embedder = init_llm_and_memory()
 
 # Initialize session state variables at the top-level
 if "vector_store" not in st.session_state:
-    st.session_state.vector_store = None
+    # One memory-mapped index per process, shared read-only by every session
+    st.session_state.vector_store = get_knowledge_index(embedder)
 if "memory" not in st.session_state:
-    st.session_state.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    # Recent turns verbatim plus a rolling summary, kept under what GPT-2's context leaves once the
+    # persona, the manual extracts, the input and the reply have their share
+    history_tokens = history_budget(llm.pipeline.tokenizer, LULU_TEMPLATE,
+                                    getattr(llm.pipeline.model.config, "n_positions", 1024),
+                                    MAX_NEW_TOKENS, KNOWLEDGE_TOKEN_BUDGET)
+    st.session_state.memory = TokenBudgetMemory(tokenizer=llm.pipeline.tokenizer, max_tokens=history_tokens)
 if "chat_chain" not in st.session_state:
-    template = """You are Lulu, an intelligent AI assistant working at Airtel Kenya. \
-    Your job is to support Sales Executives who manage over 200 on-the-ground agents. \ Give short answers because Sales Executives are busy and need short consie answers.\
-    Help them with operations, float requests, KYC issues, training updates, and urgent tickets. \
-    Always respond professionally, concisely, and with context relevant to Airtel's field operations.
-
-    Current conversation:
-    {chat_history}
-    Human: {input}
-    Assistant:"""
-    prompt = PromptTemplate(input_variables=["chat_history", "input"], template=template)
+    prompt = PromptTemplate(input_variables=["context", "chat_history", "input"], template=LULU_TEMPLATE)
     st.session_state.chat_chain = ConversationChain(
         llm=llm, # This is the HuggingFacePipeline instance
-        memory=st.session_state.memory,
+        # Conversation history plus manual extracts retrieved for each input (RAG)
+        memory=CombinedMemory(memories=[
+            st.session_state.memory,
+            KnowledgeMemory(index=st.session_state.vector_store, tokenizer=llm.pipeline.tokenizer,
+                            input_tokens=INPUT_TOKEN_BUDGET),
+        ]),
         prompt=prompt,
-        # memory_key="chat_history" is now inferred from ConversationBufferMemory.
     )
 
  #--- Custom CSS for UI styling ---
@@ -228,28 +227,9 @@ def inject_custom_css():
     """)
 
 # --- Helper functions for parsing and data loading ---
-def parse_thoughts(response_text):
-    # Extract text inside <think>...</think>
-    match = re.search(r"<think>(.*?)</think>", response_text, re.DOTALL)
-    if match:
-        thought = match.group(1).strip()
-        cleaned_response = re.sub(r"<think>.*?</think>", "", response_text, flags=re.DOTALL).strip()
-        return thought, cleaned_response
-    return None, response_text
-
-# Load shop data from JSON file (ensure this path is correct on your system)
-try:
-    with open("/Users/danielwanganga/Documents/ChatBot/shop_location.json", "r") as f:
-        SHOP_LOCATIONS = json.load(f)
-except FileNotFoundError:
-    st.error("Error: 'shop_location.json' not found. Please ensure the file exists at the specified path.")
-    SHOP_LOCATIONS = {} # Initialize as empty to prevent further errors
-
 def find_shop_by_keyword(query):
-    for shop_name, shop_data in SHOP_LOCATIONS.items():
-        if shop_name.lower() in query.lower():
-            return shop_data
-    return None
+    # Ranked, typo-tolerant lookup over the current shop catalogue
+    return get_shop_index().best_match(query)
 
 def format_shop_info(shop_data):
     name = shop_data.get("SHOP NAME", "N/A")
@@ -261,84 +241,262 @@ def format_shop_info(shop_data):
     maps_link = f"https://www.google.com/maps/search/?api=1&query={lat},{lon}" if lat and lon else ""
     return f"**{name}**\n📍 {location}\n🕒 {shop_data.get('Business Hours', '')}\n🌍 [View on Maps]({maps_link})"
 
-def is_shop_query(user_input):
-    keywords = ["shop", "location", "nearest shop", "where can I find", "shop near me"]
-    return any(k in user_input.lower() for k in keywords)
+# ---------------- Deterministic Handlers ------------------
+# Structured questions are answered from data directly; the router sends only open-ended ones to the model.
+# A handler returns None when the message has nothing it can look up, and the model answers instead.
+OPEN_QUESTION_PATTERN = re.compile(r"\bopen\b", re.IGNORECASE)
+LEAVE_BALANCE_PATTERN = re.compile(r"\b(balance|left|remaining|remain|used|how (many|much))\b", re.IGNORECASE)
+
+def shop_reply(user_input):
+    # "open on sunday at 9am" asks about that moment; otherwise it is now
+    now = datetime.datetime.now()
+    when = parse_when(user_input, now)
+    moment = "right now" if when == now else when.strftime("on %A at %H:%M")
+    coordinates = find_coordinates(user_input)
+    if coordinates:
+        geo_index = get_shop_geo_index()
+        nearby, heading = geo_index.nearest(*coordinates, open_at=when), f"These are the nearest shops open {moment}"
+        if not nearby:
+            nearby, heading = geo_index.nearest(*coordinates, open_only=False), f"No shop is open {moment}; these are the nearest"
+        if nearby:
+            shop_info = "\n\n".join(f"{format_shop_info(s['shop'])} ({s['distance_km']} km away)" for s in nearby)
+            return f"{heading}:\n\n{shop_info}"
+    shop_data = find_shop_by_keyword(user_input)
+    if shop_data:
+        return f"Here's the information for the shop you requested:\n\n{format_shop_info(shop_data)}"
+    if OPEN_QUESTION_PATTERN.search(user_input):
+        open_shops = get_shop_catalogue().open_at(when)
+        if not open_shops:
+            return f"No shop is open {moment}."
+        return f"{len(open_shops)} shops are open {moment}: " + ", ".join(open_shops)
+    return None
 
-def handle_user_input(user_input):
+def ticket_reply(user_input):
+    # Read-only indexed lookups: ticket ids get their status, MSISDNs the agent's open tickets
+    conn = get_read_connection()
+    ticket_ids, msisdns = find_ticket_references(conn, user_input)
+    if not ticket_ids and not msisdns:
+        return None
+    replies = [ticket_status_reply(conn, ticket_ids)] if ticket_ids else []
+    st.session_state.ticket_pages = {}
+    for msisdn in msisdns:
+        reply, next_cursor = agent_tickets_reply(conn, msisdn)
+        replies.append(reply)
+        if next_cursor:
+            st.session_state.ticket_pages[msisdn] = next_cursor
+    return "\n\n".join(replies)
+
+def more_agent_tickets(msisdn):
+    # Next page for the "More open tickets" button
+    reply, next_cursor = agent_tickets_reply(get_read_connection(), msisdn, after=st.session_state.ticket_pages.pop(msisdn))
+    if next_cursor:
+        st.session_state.ticket_pages[msisdn] = next_cursor
+    add_chat_message("bot", reply)
+
+def leave_reply(user_input):
+    # Only the user's own balance is looked up; leave forms and policy are for the model
+    if not LEAVE_BALANCE_PATTERN.search(user_input):
+        return None
+    user = st.session_state.get("user")
+    if not isinstance(user, dict) or "cumulative_leave" not in user:
+        return "I couldn't find leave records for your profile. Please sign in or check with your manager."
+    remaining = user["cumulative_leave"] - user["used_leave"]
+    return (f"You have **{remaining}** leave days remaining: {user['used_leave']} used "
+            f"of {user['cumulative_leave']} this year.")
+
+ROUTE_HANDLERS = {"shop": shop_reply, "ticket": ticket_reply, "leave": leave_reply}
+
+def is_signed_in():
+    user = st.session_state.get("user")
+    return isinstance(user, dict) and bool(user.get("email"))
+
+def current_user_id():
+    # Fair-share and chat-history key: the signed-in user, else this browser session. The
+    # session key lives only as long as the tab's Streamlit session, so an anonymous
+    # user's history cannot be reopened after a reload.
+    user = st.session_state.get("user")
+    if isinstance(user, dict) and user.get("email"):
+        return user["email"]
+    return st.session_state.setdefault("session_key", uuid.uuid4().hex)
+
+def chat_session_id():
+    # One id per conversation; "New conversation" and resuming an old one replace it
+    return st.session_state.setdefault("chat_session_id", uuid.uuid4().hex)
+
+def add_chat_message(role, content):
+    # Shown in this session and written to the persistent history straight away
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    st.session_state.chat_messages.append({"role": role, "content": content, "timestamp": timestamp})
+    append_message(get_connection(), current_user_id(), chat_session_id(), role, content, timestamp)
+
+def load_chat_session(session_id, before_id=None):
+    # Show a stored conversation one page at a time; the latest page also primes Lulu's memory
+    messages, has_more = fetch_messages(get_connection(), session_id, before_id=before_id)
+    shown = [{"role": m["role"], "content": m["content"], "timestamp": m["created_at"]} for m in messages]
+    if before_id is None:
+        st.session_state.chat_session_id = session_id
+        st.session_state.chat_messages = shown
+        st.session_state.memory.clear()
+        for user_msg, bot_msg in zip(messages, messages[1:]):
+            if user_msg["role"] == "user" and bot_msg["role"] == "bot":
+                st.session_state.memory.save_context({"input": user_msg["content"]}, {"response": bot_msg["content"]})
+    else:
+        st.session_state.chat_messages = shown + st.session_state.chat_messages
+    st.session_state.chat_oldest_id = messages[0]["message_id"] if messages else None
+    st.session_state.chat_has_more = has_more
+
+def past_conversations():
+    # The user's stored conversations, newest first, a page at a time
+    with st.expander("🕘 Past conversations"):
+        if not is_signed_in():
+            st.caption("You are not signed in, so your conversations are kept for this browser tab only "
+                       "and can't be reopened after a reload. Sign in to keep them.")
+        if st.button("➕ New conversation"):
+            st.session_state.chat_session_id = uuid.uuid4().hex
+            st.session_state.chat_messages = []
+            st.session_state.chat_has_more = False
+            st.session_state.memory.clear()
+            st.rerun()
+        cursors = st.session_state.setdefault("chat_session_cursors", [None])
+        sessions, next_cursor = list_sessions(get_connection(), current_user_id(), before=cursors[-1])
+        for session in sessions:
+            col1, col2 = st.columns([4, 1])
+            col1.write(f"**{session['title']}** · {session['message_count']} messages · {session['last_message_at']}")
+            if col2.button("Resume", key=f"resume_{session['session_id']}"):
+                load_chat_session(session["session_id"])
+                st.rerun()
+        col1, col2 = st.columns(2)
+        if len(cursors) > 1 and col1.button("← Newer"):
+            cursors.pop()
+            st.rerun()
+        if next_cursor and col2.button("Older →"):
+            cursors.append(next_cursor)
+            st.rerun()
+
+def export_chat(session_id):
+    # Runs only when the download is clicked, so a rerun never reads the conversation
+    export = io.StringIO()
+    export_messages(get_read_connection(), export, session_id=session_id)
+    return export.getvalue()
+
+def turn_stage(name):
+    # Times one stage of the current turn (see bench_chat.py)
+    timer = st.session_state.get("turn_timer")
+    return timer.stage(name) if timer else nullcontext()
+
+def load_prompt_variables(user_input):
+    # Conversation history and retrieved manual extracts for this turn, loaded once
+    with turn_stage("prompt"):
+        return st.session_state.chat_chain.memory.load_memory_variables({"input": user_input})
+
+def build_lulu_prompt(user_input, variables):
+    # The same prompt ConversationChain would build
+    with turn_stage("prompt"):
+        prompt_text = st.session_state.chat_chain.prompt.format(input=user_input, **variables)
+    st.session_state.last_prompt = prompt_text
+    return prompt_text
+
+def stream_lulu_reply(user_input, variables):
+    # Generate token by token, inside a shared batch when batching is on
+    chain = st.session_state.chat_chain
+    prompt_text = build_lulu_prompt(user_input, variables)
+    if BATCH_INFERENCE:
+        generation = get_inference_service(llm, LULU_PREFIX).stream(prompt_text, current_user_id())
+    else:
+        generation = StreamingGeneration(llm.pipeline, prompt_text, prefix_cache=get_prefix_cache(llm, LULU_PREFIX))
+    with turn_stage("generate"):
+        st.write_stream(generation)
+
+    # Only the final text goes into memory and chat history
+    with turn_stage("memory"):
+        chain.memory.save_context({"input": user_input}, {"response": generation.text})
+    st.session_state.generation_stats = generation.stats()
+    return generation.text
+
+def handle_user_input(user_input):
+    st.session_state.turn_timer = StageTimer()
 
     # Add user message to history
-    st.session_state.chat_messages.append({
-        "role": "user",
-        "content": user_input,
-        "timestamp": timestamp
-    })
+    with turn_stage("history"):
+        add_chat_message("user", user_input)
 
-    with st.spinner("Lulu is thinking..."):
+    streaming = st.session_state.get("stream_responses", STREAM_RESPONSES)
+    with nullcontext() if streaming else st.spinner("Lulu is thinking..."):
         # For ConversationChain, it always expects 'input'
         inputs = {"input": user_input}
+        memory = st.session_state.chat_chain.memory
 
         try:
-            result = st.session_state.chat_chain.invoke(inputs)
-
-            # Handle HuggingFacePipeline output (it returns a list of dicts)
-            # We need to extract the 'generated_text' from the pipeline's output
-            if isinstance(result, list) and len(result) > 0 and 'generated_text' in result[0]:
-                raw_generated_text = result[0]['generated_text']
-                
-                # Find the last occurrence of "Assistant:" and take everything after it
-                assistant_tag = "Assistant:"
-                if assistant_tag in raw_generated_text:
-                    response = raw_generated_text.rsplit(assistant_tag, 1)[-1].strip()
-                else:
-                    # Fallback if "Assistant:" isn't found (unlikely if template is consistent)
-                    response = raw_generated_text.strip()
-                    
+            with turn_stage("route"):
+                intent, _ = get_intent_router().route(user_input)
+            response = None
+            if intent in ROUTE_HANDLERS:
+                with turn_stage(intent):
+                    response = ROUTE_HANDLERS[intent](user_input)
+                if response is None:
+                    intent = FALLBACK_INTENT
+            st.session_state.last_route = intent
+            if response is not None:
+                st.session_state.last_reply_cached = False
+                with turn_stage("memory"):
+                    memory.save_context(inputs, {"response": response})
+                with turn_stage("history"):
+                    add_chat_message("bot", response)
+                st.rerun()
+
+            # Frequent opening questions are answered from the shared cache without touching the
+            # model. Answers depend on the retrieved extracts, so those scope the entry; once the
+            # conversation has history the answer is this user's own and the cache is skipped.
+            variables = load_prompt_variables(user_input)
+            cacheable = not variables.get("chat_history")
+            response_cache = get_response_cache(embedder)
+            response = None
+            if cacheable:
+                with turn_stage("cache"):
+                    response = response_cache.get(user_input, variables.get("context", ""))
+            st.session_state.last_reply_cached = response is not None
+            if response is not None:
+                with turn_stage("memory"):
+                    memory.save_context(inputs, {"response": response})
+            elif streaming:
+                response = stream_lulu_reply(user_input, variables)
+            elif BATCH_INFERENCE:
+                prompt_text = build_lulu_prompt(user_input, variables)
+                with turn_stage("generate"):
+                    response = get_inference_service(llm, LULU_PREFIX).generate(prompt_text, current_user_id())
+                with turn_stage("memory"):
+                    memory.save_context(inputs, {"response": response})
             else:
-                response = str(result) # fallback for unexpected output structure
+                # The chain builds the prompt, generates and saves to memory in one call
+                with turn_stage("generate"):
+                    result = st.session_state.chat_chain.invoke(inputs)
+                with turn_stage("parse"):
+                    response = extract_reply(result)
+
+            if cacheable and not st.session_state.last_reply_cached:
+                with turn_stage("cache"):
+                    response_cache.put(user_input, response, variables.get("context", ""))
 
             # Parse thoughts if any
-            thought, cleaned_response = parse_thoughts(response)
+            with turn_stage("parse"):
+                thought, response_content = parse_thoughts(response)
             if thought:
                 with st.expander("🤖 Internal reasoning"):
                     st.markdown(thought)
-                response_content = cleaned_response
-            else:
-                response_content = response
 
             # Add bot message to history
-            st.session_state.chat_messages.append({
-                "role": "bot",
-                "content": response_content,
-                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-
-            # Special handling for shop queries after LLM response
-            if is_shop_query(user_input):
-                shop_data = find_shop_by_keyword(user_input)
-                if shop_data:
-                    shop_info = format_shop_info(shop_data)
-                    st.session_state.chat_messages.append({
-                        "role": "bot",
-                        "content": f"Here's the information for the shop you requested:\n\n{shop_info}",
-                        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    })
-                else:
-                    st.session_state.chat_messages.append({
-                        "role": "bot",
-                        "content": "Sorry, I couldn’t find a matching shop. Please try specifying the town or shop name more clearly.",
-                        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    })
+            with turn_stage("history"):
+                add_chat_message("bot", response_content)
+
+            st.rerun()
+
+        except ServiceBusy as e: # Admission control turned the request away; nothing was generated
+            add_chat_message("bot", str(e))
             st.rerun()
 
         except Exception as e: # Generic exception handling for Hugging Face inference errors
             st.error(f"An unexpected error occurred during chatbot interaction: {e}")
-            st.session_state.chat_messages.append({
-                "role": "bot",
-                "content": "An error occurred while processing your request. Please try again or rephrase your question.",
-                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
+            add_chat_message("bot", "An error occurred while processing your request. Please try again or rephrase your question.")
             st.rerun()
 
 
@@ -350,6 +508,14 @@ def chatbot():
     if "chat_messages" not in st.session_state:
         st.session_state.chat_messages = []
 
+    catalogue_error = get_catalogue_loader().error
+    if catalogue_error:
+        st.error(catalogue_error)
+
+    past_conversations()
+    if st.session_state.get("chat_has_more") and st.button("⬆️ Load earlier messages"):
+        load_chat_session(chat_session_id(), before_id=st.session_state.chat_oldest_id)
+        st.rerun()
 
     # Display chat messages in a dedicated container for better scrolling
     st.markdown('<div class="chat-container">', unsafe_allow_html=True)
@@ -368,6 +534,20 @@ def chatbot():
         """, unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True) # Close chat container
 
+    # Speed of the last streamed reply
+    stats = st.session_state.get("generation_stats")
+    if stats and stats["time_to_first_token"] is not None:
+        tokens_per_second = f"{stats['tokens_per_second']:.1f} tokens/s" if stats["tokens_per_second"] else "n/a"
+        st.caption(f"⏱️ First token in {stats['time_to_first_token']:.2f}s · {stats['tokens']} tokens · {tokens_per_second}")
+    if BATCH_INFERENCE and stats:
+        service = get_inference_service(llm, LULU_PREFIX).metrics()
+        average = f"{service['average_batch_size']:.1f}" if service["average_batch_size"] else "n/a"
+        st.caption(f"🧵 {service['queue_depth']} waiting · average batch {average} · {service['rejected']} turned away")
+
+    if st.session_state.get("last_reply_cached"):
+        cache_stats = get_response_cache(embedder).stats()
+        st.caption(f"⚡ Answered from cache · {cache_stats['hit_rate']:.0%} of questions served from cache")
+
     # Quick actions only shown at the start of a conversation
     if len(st.session_state.chat_messages) == 0:
         st.markdown("<br>", unsafe_allow_html=True) # Add some space
@@ -383,8 +563,14 @@ def chatbot():
                 if st.button(response, key=f"quick_action_{response}"): # Add unique key
                     handle_user_input(response)
 
+    for msisdn in list(st.session_state.get("ticket_pages", {})):
+        if st.button(f"➡️ More open tickets for {msisdn}", key=f"more_tickets_{msisdn}"):
+            more_agent_tickets(msisdn)
+            st.rerun()
+
     st.markdown("<br>", unsafe_allow_html=True) # Add some space before input
 
+    st.toggle("⚡ Stream responses", value=STREAM_RESPONSES, key="stream_responses")
     user_text_input = st.chat_input("Ask Lulu a question...")
 
     current_input = None
@@ -396,10 +582,9 @@ def chatbot():
         handle_user_input(current_input)
 
     st.markdown("<br>", unsafe_allow_html=True) # Add some space
-    if st.button("📄 Export Chat as JSON"):
-        with open("chat_history.json", "w") as f:
-            json.dump(st.session_state.chat_messages, f, indent=2)
-        st.success("Chat history exported to chat_history.json ✅")
+    # Generated from the history store on click, reading this conversation only
+    st.download_button("📄 Export Chat as JSONL", functools.partial(export_chat, chat_session_id()),
+                       file_name=f"chat_{chat_session_id()}.jsonl", mime="application/jsonl")
 
 # Run the chatbot application
 chatbot()
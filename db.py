@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import threading
+import streamlit as st
+from migrations import migrate
+
+# ---------------- Configuration ------------------
+DB_PATH = os.getenv("CHANNEL_PARTNERS_DB", "channel_partners_agents.db")
+BUSY_TIMEOUT_MS = 5000
+
+# ---------------- Data Access ------------------
+class Database:
+    """
+    Process-wide handle on the SQLite database.
+
+    Each thread gets its own connection (Streamlit runs every session's script on
+    its own thread), configured for WAL so readers never block the single writer.
+    A thread's connection is closed when the thread exits and its local is freed.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self.connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        migrate(conn)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def connection(self):
+        """Returns the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def reader(self):
+        """Returns the calling thread's read-only connection, for lookups that must never write."""
+        conn = getattr(self._local, "reader", None)
+        if conn is None:
+            conn = self._local.reader = self._connect()
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def close(self):
+        """Closes the calling thread's connections, e.g. at the end of a worker thread."""
+        for name in ("conn", "reader"):
+            conn = getattr(self._local, name, None)
+            if conn is not None:
+                conn.close()
+                setattr(self._local, name, None)
+
+@st.cache_resource
+def get_db():
+    return Database()
+
+def get_connection():
+    """Shortcut used by the pages: the current thread's connection to the shared database."""
+    return get_db().connection()
+
+def get_read_connection():
+    """The current thread's read-only connection to the shared database."""
+    return get_db().reader()
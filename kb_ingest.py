@@ -0,0 +1,190 @@
+import argparse
+import glob
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from PyPDF2 import PdfReader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from tickets import TIMESTAMP_FORMAT
+
+# ---------------- Configuration ------------------
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+EMBED_BATCH_SIZE = 512
+
+# ---------------- Fingerprints ------------------
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def chunk_hash(text):
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+# ---------------- Extraction (runs in worker processes) ------------------
+def extract_and_chunk(path):
+    """Reads a PDF and splits each page into overlapping chunks. Returns (path, pages, chunks)."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    reader = PdfReader(path)
+    chunks, seen = [], set()
+    for page_number, page in enumerate(reader.pages, start=1):
+        for text in splitter.split_text(page.extract_text() or ""):
+            digest = chunk_hash(text)
+            # Boilerplate repeated on every page (headers, footers) is indexed once
+            if text.strip() and digest not in seen:
+                seen.add(digest)
+                chunks.append({"text": text, "page": page_number, "chunk_hash": digest})
+    return path, len(reader.pages), chunks
+
+def find_pdfs(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(glob.glob(os.path.join(path, "**", "*.pdf"), recursive=True))
+        else:
+            found.extend(glob.glob(path))
+    return sorted({os.path.abspath(p) for p in found})
+
+# ---------------- Ingestion ------------------
+class Ingestion:
+    """
+    Brings the knowledge index in line with a set of PDFs.
+
+    Unchanged files (same SHA-256) are skipped outright; for changed files only
+    chunks whose text hash is new get embedded, chunks that disappeared are
+    deleted, and everything else is left in place. Embedding runs in batches as
+    documents come in; all changes are then written in one transaction and one
+    index rewrite at the end of the run. A file that cannot be read is reported
+    in `failures` and left for the next run; the others are still indexed.
+    """
+
+    def __init__(self, db, index, embedder, workers=None, batch_size=EMBED_BATCH_SIZE, log=print):
+        self.db = db
+        self.index = index
+        self.embedder = embedder
+        self.workers = workers
+        self.batch_size = batch_size
+        self.log = log
+        self.stats = {"files": 0, "skipped": 0, "failed": 0, "pages": 0, "chunks": 0, "embedded": 0, "deleted": 0}
+        self.failures = []
+        self._pending = []
+        self._embedded = []
+
+    def run(self, pdf_paths, prune=False):
+        started = time.perf_counter()
+        conn = self.db.connection()
+        known = {row[0]: row[1] for row in conn.execute("SELECT doc_id, sha256 FROM kb_documents")}
+
+        changed = []
+        for path in pdf_paths:
+            digest = file_sha256(path)
+            if known.get(path) == digest:
+                self.stats["skipped"] += 1
+            else:
+                changed.append((path, digest))
+
+        digests = dict(changed)
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(extract_and_chunk, path): path for path, _ in changed}
+            for future in as_completed(futures):
+                try:
+                    path, pages, chunks = future.result()
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    self.failures.append((futures[future], str(e)))
+                    self.log(f"Skipped {os.path.basename(futures[future])}: {e}")
+                    continue
+                self.stats["files"] += 1
+                self.stats["pages"] += pages
+                self.stats["chunks"] += len(chunks)
+                self._queue(conn, path, digests[path], pages, chunks)
+        self._embed()
+
+        removed = sorted(set(known) - set(pdf_paths)) if prune else []
+        self._write(conn, removed)
+
+        self.stats["seconds"] = time.perf_counter() - started
+        return self.stats
+
+    def _queue(self, conn, path, digest, pages, chunks):
+        existing = dict(conn.execute("SELECT chunk_hash, chunk_id FROM kb_chunks WHERE doc_id = ?", (path,)).fetchall())
+        new_chunks = [chunk for chunk in chunks if chunk["chunk_hash"] not in existing]
+        current = {chunk["chunk_hash"] for chunk in chunks}
+        stale_ids = [chunk_id for digest_, chunk_id in existing.items() if digest_ not in current]
+        self._pending.append((path, digest, pages, new_chunks, stale_ids))
+        if sum(len(item[3]) for item in self._pending) >= self.batch_size:
+            self._embed()
+
+    def _embed(self):
+        """Embeds every queued new chunk in one batch; the documents wait for _write."""
+        if not self._pending:
+            return
+        texts = [chunk["text"] for item in self._pending for chunk in item[3]]
+        vectors = self.embedder.embed_documents(texts) if texts else []
+        offset = 0
+        for item in self._pending:
+            self._embedded.append((*item, vectors[offset:offset + len(item[3])]))
+            offset += len(item[3])
+        self._pending = []
+
+    def _write(self, conn, removed):
+        """
+        Writes every embedded document and removal in one transaction and one index
+        rewrite; the transaction commits only after the new index file is in place.
+        """
+        if not self._embedded and not removed:
+            return
+        with conn, self.index.batch():
+            for path, digest, pages, new_chunks, stale_ids, vectors in self._embedded:
+                self.index.delete_chunks(conn, stale_ids)
+                self.index.add_chunks(conn, path, new_chunks, vectors)
+                conn.execute("""
+                    INSERT INTO kb_documents (doc_id, source, sha256, pages, updated_at) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (doc_id) DO UPDATE SET
+                        sha256 = excluded.sha256, pages = excluded.pages, updated_at = excluded.updated_at
+                """, (path, os.path.basename(path), digest, pages, datetime.now().strftime(TIMESTAMP_FORMAT)))
+            for doc_id in removed:
+                self.index.delete_document(conn, doc_id)
+        for path, digest, pages, new_chunks, stale_ids, vectors in self._embedded:
+            self.stats["embedded"] += len(new_chunks)
+            self.stats["deleted"] += len(stale_ids)
+            self.log(f"Indexed {os.path.basename(path)}: {len(new_chunks)} new, {len(stale_ids)} removed chunks")
+        for doc_id in removed:
+            self.log(f"Removed {doc_id}")
+        self._embedded = []
+
+def main(argv=None):
+    from db import DB_PATH, Database
+    from knowledge_index import KNOWLEDGE_DIR, KnowledgeIndex
+    from lulu_models import configure_threads, load_embedder
+
+    parser = argparse.ArgumentParser(description="Add or refresh PDF circulars in Lulu's knowledge index.")
+    parser.add_argument("paths", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("--db", default=DB_PATH, help="Path to the SQLite database")
+    parser.add_argument("--index-dir", default=KNOWLEDGE_DIR, help="Directory holding index.faiss")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--prune", action="store_true", help="Drop indexed documents not among the given paths")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    # Same backend (LULU_EMBED_BACKEND) as the chatbot, so stored and query vectors match
+    configure_threads()
+    embedder = load_embedder()
+    index = KnowledgeIndex(db, embedder, args.index_dir)
+    stats = Ingestion(db, index, embedder, args.workers, args.batch_size).run(find_pdfs(args.paths), args.prune)
+
+    seconds = stats["seconds"] or 1e-9
+    print(
+        f"{stats['files']} files processed, {stats['skipped']} unchanged, {stats['failed']} failed; "
+        f"{stats['pages']} pages, {stats['chunks']} chunks ({stats['embedded']} embedded, {stats['deleted']} removed) "
+        f"in {seconds:.1f}s: {stats['pages'] / seconds:.1f} pages/s, {stats['chunks'] / seconds:.1f} chunks/s. "
+        f"Index now holds {len(index)} chunks."
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, List, Optional
+import faiss
+import numpy as np
+import streamlit as st
+from langchain.docstore.document import Document
+from langchain_core.memory import BaseMemory
+from db import get_db
+
+# ---------------- Configuration ------------------
+KNOWLEDGE_DIR = os.getenv("LULU_KNOWLEDGE_DIR", "knowledge_index")
+INDEX_FILE = "index.faiss"
+TOP_K = 4
+# Most of the prompt {context} may take; GPT-2 sees 1024 tokens in all (see lulu_memory.history_budget)
+KNOWLEDGE_TOKEN_BUDGET = 256
+
+# ---------------- Shared Vector Index ------------------
+class KnowledgeIndex:
+    """
+    Process-wide FAISS index over the operations manuals (float, KYC, onboarding,
+    commission...).
+
+    Vectors live in knowledge_index/index.faiss, memory-mapped read-only so every
+    session shares the same pages; chunk text and provenance live in the kb_chunks
+    table, whose chunk_id is the FAISS id. Writers update a private in-memory
+    copy and swap the file in atomically; readers pick up the new file on their
+    next search, also when it was written by another process (e.g. the ingestion
+    CLI). Rewriting the file costs O(index size), so bulk writers group their
+    changes with batch() and pay it once.
+    """
+
+    def __init__(self, db, embedder, directory=KNOWLEDGE_DIR):
+        self.db = db
+        self.embedder = embedder
+        self.path = os.path.join(directory, INDEX_FILE)
+        self._index = None
+        self._mtime = None
+        # Re-entrant so add_chunks/delete_chunks can run inside batch() on the same thread
+        self._write_lock = threading.RLock()
+        self._batching = False
+        self._batch = None
+        self._reload()
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._index, self._mtime = None, None
+            return
+        if mtime != self._mtime:
+            self._index = faiss.read_index(self.path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            self._mtime = mtime
+
+    def __len__(self):
+        self._reload()
+        return self._index.ntotal if self._index is not None else 0
+
+    # ---------------- Reads ------------------
+    def search_vectors(self, vectors, k=TOP_K):
+        """Top-k (scores, chunk_ids) for a batch of query vectors; ids of -1 mean no hit."""
+        self._reload()
+        index = self._index
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if index is None or index.ntotal == 0:
+            return np.zeros((len(vectors), 0), dtype="float32"), np.zeros((len(vectors), 0), dtype="int64")
+        faiss.normalize_L2(vectors)
+        return index.search(vectors, min(k, index.ntotal))
+
+    def search(self, query, k=TOP_K):
+        """Returns the k most relevant manual chunks for `query` as LangChain Documents."""
+        scores, ids = self.search_vectors(np.array([self.embedder.embed_query(query)]), k)
+        hits = [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i >= 0]
+        if not hits:
+            return []
+        rows = {
+            row[0]: row[1:]
+            for row in self.db.connection().execute(f"""
+                SELECT c.chunk_id, c.text, c.page, d.source
+                FROM kb_chunks c JOIN kb_documents d ON d.doc_id = c.doc_id
+                WHERE c.chunk_id IN ({', '.join('?' * len(hits))})
+            """, [i for i, _ in hits])
+        }
+        return [
+            Document(page_content=rows[i][0], metadata={"source": rows[i][2], "page": rows[i][1], "score": score})
+            for i, score in hits if i in rows
+        ]
+
+    # ---------------- Writes ------------------
+    def _writable_copy(self, dimension):
+        if os.path.exists(self.path):
+            return faiss.read_index(self.path)
+        if dimension is None:
+            return None
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+    def _swap_in(self, index):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, self.path)
+        self._reload()
+
+    @contextmanager
+    def _editing(self, dimension=None):
+        """The writable index to change: the batch's copy inside batch(), else a fresh copy swapped in afterwards."""
+        with self._write_lock:
+            if self._batching:
+                if self._batch is None:
+                    self._batch = self._writable_copy(dimension)
+                yield self._batch
+                return
+            index = self._writable_copy(dimension)
+            yield index
+            if index is not None:
+                self._swap_in(index)
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups add_chunks / delete_chunks calls into one read and one rewrite of the
+        index file, written when the block exits without an error. Other writers
+        wait until then. The caller's transaction should enclose the block, so it
+        commits only after the file is in place.
+        """
+        with self._write_lock:
+            if self._batching:
+                yield self
+                return
+            self._batching, self._batch = True, None
+            try:
+                yield self
+                if self._batch is not None:
+                    self._swap_in(self._batch)
+            finally:
+                self._batching, self._batch = False, None
+
+    def add_chunks(self, conn, doc_id, chunks, vectors):
+        """
+        Adds embedded chunks of one document. `chunks` are dicts with text, page and
+        chunk_hash. Runs on the caller's transaction, which should commit only after
+        this returns (or, inside batch(), after the batch ends), so kb_chunks never
+        points at vectors that were not written.
+        """
+        if not chunks:
+            return []
+        ids = [
+            conn.execute(
+                "INSERT INTO kb_chunks (doc_id, chunk_hash, page, text) VALUES (?, ?, ?, ?)",
+                (doc_id, chunk["chunk_hash"], chunk.get("page"), chunk["text"]),
+            ).lastrowid
+            for chunk in chunks
+        ]
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        faiss.normalize_L2(vectors)
+        with self._editing(vectors.shape[1]) as index:
+            index.add_with_ids(vectors, np.array(ids, dtype="int64"))
+        return ids
+
+    def delete_chunks(self, conn, chunk_ids):
+        """Removes chunks from the index and kb_chunks (on the caller's transaction)."""
+        if not chunk_ids:
+            return
+        with self._editing() as index:
+            if index is not None:
+                index.remove_ids(np.array(chunk_ids, dtype="int64"))
+        conn.executemany("DELETE FROM kb_chunks WHERE chunk_id = ?", [(i,) for i in chunk_ids])
+
+    def delete_document(self, conn, doc_id):
+        ids = [row[0] for row in conn.execute("SELECT chunk_id FROM kb_chunks WHERE doc_id = ?", (doc_id,))]
+        self.delete_chunks(conn, ids)
+        conn.execute("DELETE FROM kb_documents WHERE doc_id = ?", (doc_id,))
+
+@st.cache_resource
+def get_knowledge_index(_embedder):
+    return KnowledgeIndex(get_db(), _embedder)
+
+# ---------------- Retrieval for the Conversation Chain ------------------
+class KnowledgeMemory(BaseMemory):
+    """
+    Read-only "memory" that fills the prompt's {context} slot with the manual
+    extracts most relevant to the current input. Nothing is ever written back,
+    so the shared index stays read-only for chat sessions.
+
+    With a `tokenizer`, the filled slot stays under `max_tokens`: the lowest-ranked
+    extracts are dropped first, and a lone extract that is still too long is cut.
+    An input longer than `input_tokens` takes the excess from the extracts.
+    """
+
+    index: Any
+    k: int = TOP_K
+    tokenizer: Any = None
+    max_tokens: int = KNOWLEDGE_TOKEN_BUDGET
+    input_tokens: Optional[int] = None
+    memory_key: str = "context"
+    input_key: str = "input"
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def _format(self, extracts):
+        lines = "\n".join(f"- {text} ({source})" for text, source in extracts)
+        return f"Relevant extracts from Airtel operations manuals:\n{lines}\n"
+
+    def _count(self, text):
+        return len(self.tokenizer.encode(text))
+
+    def load_memory_variables(self, inputs):
+        query = inputs.get(self.input_key) if inputs else None
+        documents = self.index.search(query, self.k) if query and len(self.index) else []
+        if not documents:
+            return {self.memory_key: ""}
+        extracts = [(doc.page_content.strip(), doc.metadata["source"]) for doc in documents]
+        if self.tokenizer is None:
+            return {self.memory_key: self._format(extracts)}
+        budget = self.max_tokens
+        if self.input_tokens is not None:
+            budget -= max(self._count(query) - self.input_tokens, 0)
+        # Search order is best first, so the end of the list goes first
+        while len(extracts) > 1 and self._count(self._format(extracts)) > budget:
+            extracts.pop()
+        overflow = self._count(self._format(extracts)) - budget
+        if overflow > 0:
+            (text, source), = extracts
+            ids = self.tokenizer.encode(text)
+            for cut in range(max(len(ids) - overflow, 0), -1, -1):
+                extracts = [(self.tokenizer.decode(ids[:cut]).rstrip() + "…", source)]
+                if self._count(self._format(extracts)) <= budget:
+                    break
+            else:
+                return {self.memory_key: ""}
+        return {self.memory_key: self._format(extracts)}
+
+    def save_context(self, inputs, outputs):
+        pass
+
+    def clear(self):
+        pass
@@ -0,0 +1,298 @@
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import torch
+import streamlit as st
+from transformers import StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+from lulu_streaming import STOP_SEQUENCES
+from lulu_prefix_cache import get_prefix_cache
+
+# ---------------- Configuration ------------------
+MAX_BATCH_SIZE = 8
+# How long the worker waits for more requests to join a batch once the first one arrived
+BATCH_WINDOW_SECONDS = 0.02
+# Admission control: requests beyond these limits are refused instead of queued
+MAX_QUEUE_DEPTH = 64
+MAX_PENDING_PER_USER = 2
+MAX_NEW_TOKENS = 200
+
+class ServiceBusy(Exception):
+    """Raised by submit() when the queue or the user's share of it is full."""
+
+# ---------------- Requests ------------------
+class GenerationRequest:
+    """One prompt waiting for (or going through) the batch worker."""
+
+    def __init__(self, prompt_ids, user, max_new_tokens, stream, prefixed=False):
+        self.prompt_ids = prompt_ids        # after the cached prefix when `prefixed`
+        self.prefixed = prefixed
+        self.user = user
+        self.max_new_tokens = max_new_tokens
+        self.future = Future()
+        self.pieces = queue.Queue() if stream else None
+        self.tokens = []
+        self.text = ""
+        self.emitted = 0
+        self.done = False
+        self.enqueued_at = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+
+    def stats(self):
+        """Same shape as StreamingGeneration.stats(), measured from when the request was queued."""
+        if self.finished_at is None or self.first_token_at is None:
+            return {"time_to_first_token": None, "tokens": len(self.tokens), "tokens_per_second": None}
+        decode_time = self.finished_at - self.first_token_at
+        return {
+            "time_to_first_token": self.first_token_at - self.enqueued_at,
+            "tokens": len(self.tokens),
+            "tokens_per_second": (len(self.tokens) - 1) / decode_time if decode_time > 0 else None,
+        }
+
+class BatchedGeneration:
+    """
+    Iterates the reply of a streaming request as it is generated inside a shared
+    batch, like StreamingGeneration; `text` and `stats()` are set afterwards.
+    """
+
+    def __init__(self, request, timeout=120):
+        self.request = request
+        self.timeout = timeout
+        self.text = ""
+
+    def __iter__(self):
+        while True:
+            piece = self.request.pieces.get(timeout=self.timeout)
+            if piece is None:
+                break
+            yield piece
+        self.text = self.request.future.result()
+
+    def stats(self):
+        return self.request.stats()
+
+# ---------------- Batch Plumbing ------------------
+class _BatchStreamer(BaseStreamer):
+    """Receives each generation step for the whole batch and hands every row's tokens to its request."""
+
+    def __init__(self, service, requests):
+        self.service = service
+        self.requests = requests
+        self.prompt_seen = False
+
+    def put(self, value):
+        if not self.prompt_seen:  # generate() first pushes the prompt itself
+            self.prompt_seen = True
+            return
+        now = time.perf_counter()
+        for request, token in zip(self.requests, value.reshape(-1).tolist()):
+            if not request.done:
+                self.service._append_token(request, token, now)
+
+    def end(self):
+        for request in self.requests:
+            if not request.done:
+                self.service._finish(request)
+
+class _StopFinishedRows(StoppingCriteria):
+    def __init__(self, requests):
+        self.requests = requests
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor([r.done for r in self.requests], dtype=torch.bool, device=input_ids.device)
+
+# ---------------- Inference Service ------------------
+class InferenceService:
+    """
+    One worker thread owning the model for the whole process.
+
+    Sessions submit prompts and get a Future (or a token stream) back. The worker
+    takes the first waiting request, waits BATCH_WINDOW_SECONDS for others, and
+    runs up to MAX_BATCH_SIZE of them as one left-padded generate() call. Requests
+    are taken round-robin across users, so one user's burst cannot starve the
+    others, and submit() refuses work beyond the queue limits instead of letting
+    latency grow without bound.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=MAX_BATCH_SIZE, window=BATCH_WINDOW_SECONDS,
+                 max_queue=MAX_QUEUE_DEPTH, max_per_user=MAX_PENDING_PER_USER, stop_sequences=STOP_SEQUENCES,
+                 prefix_cache=None, **generate_kwargs):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_cache = prefix_cache
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.stop_sequences = stop_sequences
+        self.generate_kwargs = {"do_sample": True, "temperature": 0.7, **generate_kwargs}
+        self.pad_token_id = tokenizer.eos_token_id
+        self.context_size = getattr(model.config, "n_positions", 1024)
+
+        self._users = OrderedDict()         # user -> deque of waiting requests, in round-robin order
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._metrics = {"submitted": 0, "rejected": 0, "batches": 0, "batched_requests": 0,
+                         "max_queue_depth": 0, "last_batch_seconds": None}
+        self.thread = threading.Thread(target=self._run, name="lulu-inference", daemon=True)
+        self.thread.start()
+
+    # ---------------- Client Side ------------------
+    def submit(self, prompt, user="anonymous", max_new_tokens=MAX_NEW_TOKENS, stream=False):
+        """Queues a prompt; returns its GenerationRequest (request.future resolves to the reply text)."""
+        max_new_tokens = min(max_new_tokens, self.context_size - 1)
+        rest_ids = self.prefix_cache.rest_ids(prompt) if self.prefix_cache else None
+        budget = self.context_size - max_new_tokens - (len(self.prefix_cache) if self.prefix_cache else 0)
+        if rest_ids is not None and budget > 0:
+            # The persona's KV state is cached; keep it and the end of whatever follows
+            request = GenerationRequest(rest_ids[-budget:], user, max_new_tokens, stream, prefixed=True)
+        else:
+            # Keep the end of an over-long prompt: the question and latest turns matter most
+            prompt_ids = self.tokenizer.encode(prompt)[-(self.context_size - max_new_tokens):]
+            request = GenerationRequest(prompt_ids, user, max_new_tokens, stream)
+        with self._condition:
+            waiting = self._users.get(user)
+            if self._pending >= self.max_queue or (waiting and len(waiting) >= self.max_per_user):
+                self._metrics["rejected"] += 1
+                raise ServiceBusy("Lulu is busy right now; please try again in a moment.")
+            self._users.setdefault(user, deque()).append(request)
+            self._pending += 1
+            self._metrics["submitted"] += 1
+            self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], self._pending)
+            self._condition.notify()
+        return request
+
+    def generate(self, prompt, user="anonymous", timeout=120, **kwargs):
+        return self.submit(prompt, user, **kwargs).future.result(timeout=timeout)
+
+    def stream(self, prompt, user="anonymous", timeout=120, **kwargs):
+        return BatchedGeneration(self.submit(prompt, user, stream=True, **kwargs), timeout)
+
+    def metrics(self):
+        with self._condition:
+            batches = self._metrics["batches"]
+            return {
+                **self._metrics,
+                "queue_depth": self._pending,
+                "waiting_users": len(self._users),
+                "average_batch_size": self._metrics["batched_requests"] / batches if batches else None,
+            }
+
+    def stop(self):
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    # ---------------- Worker Side ------------------
+    def _take_batch(self):
+        """Waits for work, lets the batch fill for `window` seconds, then takes requests round-robin by user."""
+        with self._condition:
+            while not self._pending and not self._stop.is_set():
+                self._condition.wait()
+            deadline = time.monotonic() + self.window
+            while self._pending < self.max_batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = []
+            while self._users and len(batch) < self.max_batch_size:
+                user, waiting = next(iter(self._users.items()))
+                batch.append(waiting.popleft())
+                self._pending -= 1
+                # Move the user to the back of the line (or drop them when nothing is left)
+                del self._users[user]
+                if waiting:
+                    self._users[user] = waiting
+            return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if not batch:
+                continue
+            with self._condition:
+                self._metrics["batches"] += 1
+                self._metrics["batched_requests"] += len(batch)
+            started = time.perf_counter()
+            try:
+                self._generate(batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.done:
+                        request.done = True
+                        request.future.set_exception(e)
+                        if request.pieces is not None:
+                            request.pieces.put(None)
+            with self._condition:
+                self._metrics["last_batch_seconds"] = time.perf_counter() - started
+
+    def _generate(self, batch):
+        # Only when every prompt starts with the cached prefix can the batch share its KV state
+        prefix = self.prefix_cache if all(r.prefixed for r in batch) else None
+        prefix_ids = prefix.ids if prefix else []
+        rows = [r.prompt_ids if prefix or not r.prefixed else self.prefix_cache.ids + r.prompt_ids for r in batch]
+
+        # Padding goes between the prefix and the rest (masked out, so positions carry on from the
+        # prefix), keeping every prompt's last token in the final column, where generation continues
+        width = len(prefix_ids) + max(len(ids) for ids in rows)
+        input_ids = torch.full((len(batch), width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+        input_ids[:, :len(prefix_ids)] = torch.tensor(prefix_ids, dtype=torch.long)
+        attention_mask[:, :len(prefix_ids)] = 1
+        for row, ids in enumerate(rows):
+            input_ids[row, width - len(ids):] = torch.tensor(ids)
+            attention_mask[row, width - len(ids):] = 1
+        max_new_tokens = min(max(r.max_new_tokens for r in batch), self.context_size - width)
+        cached = {"past_key_values": prefix.past_for(len(batch))} if prefix else {}
+        with torch.no_grad():
+            self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=max_new_tokens,
+                **cached,
+                pad_token_id=self.pad_token_id,
+                streamer=_BatchStreamer(self, batch),
+                stopping_criteria=StoppingCriteriaList([_StopFinishedRows(batch)]),
+                **self.generate_kwargs,
+            )
+
+    def _append_token(self, request, token, now):
+        if request.first_token_at is None:
+            request.first_token_at = now
+        if token == self.tokenizer.eos_token_id:
+            self._finish(request)
+            return
+        request.tokens.append(token)
+        request.text = self.tokenizer.decode(request.tokens, skip_special_tokens=True)
+        stop_at = min((i for i in (request.text.find(s) for s in self.stop_sequences) if i >= 0), default=-1)
+        if stop_at >= 0:
+            request.text = request.text[:stop_at]
+            self._finish(request)
+        elif len(request.tokens) >= request.max_new_tokens:
+            self._finish(request)
+        elif request.pieces is not None and not request.text.endswith("\ufffd"):
+            # Hold back a few characters that could be the start of a stop sequence (and half a character)
+            safe = len(request.text) - max(map(len, self.stop_sequences))
+            if safe > request.emitted:
+                request.pieces.put(request.text[request.emitted:safe])
+                request.emitted = safe
+
+    def _finish(self, request):
+        request.done = True
+        request.finished_at = time.perf_counter()
+        if request.pieces is not None:
+            if len(request.text) > request.emitted:
+                request.pieces.put(request.text[request.emitted:])
+            request.pieces.put(None)
+        request.future.set_result(request.text.strip())
+
+@st.cache_resource
+def get_inference_service(_llm, prefix=""):
+    """The process-wide batch worker around the loaded text model, with `prefix`'s KV state cached."""
+    return InferenceService(_llm.pipeline.model, _llm.pipeline.tokenizer, prefix_cache=get_prefix_cache(_llm, prefix))
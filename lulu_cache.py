@@ -0,0 +1,138 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+import streamlit as st
+
+# ---------------- Configuration ------------------
+CACHE_MAX_ENTRIES = 512
+CACHE_TTL_SECONDS = 6 * 60 * 60
+# Cosine similarity above which two questions are treated as the same question
+SIMILARITY_THRESHOLD = 0.92
+
+def normalise_question(text):
+    """Lower-case words only, so 'KYC Approval', 'kyc approval?' and ' KYC  approval' share a key."""
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+# ---------------- Response Cache ------------------
+class ResponseCache:
+    """
+    Process-wide answer cache in front of the conversation chain.
+
+    Lookups try the exact normalised question first and otherwise fall back to
+    the closest cached question by embedding similarity. Answers also depend on
+    what the prompt carried besides the question, so every entry is scoped to
+    the `context` it was generated with (the retrieved manual extracts): only
+    entries with the same context are ever returned. Callers only use the cache
+    when there is no per-user conversation history to account for. Entries
+    expire after `ttl` seconds and the least recently used one is evicted beyond
+    `max_entries`. Safe to share across sessions (one lock around the dict).
+    """
+
+    def __init__(self, embedder, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS, threshold=SIMILARITY_THRESHOLD):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()           # (scope, key) -> (response, unit vector, stored_at)
+        self._matrix = None                     # (keys, scopes, stacked vectors), rebuilt after changes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        # The question embedded on a miss is embedded again by put(); do it once
+        self._embed = lru_cache(maxsize=256)(self._embed_uncached)
+
+    def _embed_uncached(self, key):
+        vector = np.asarray(self.embedder.embed_query(key), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self, now):
+        expired = [key for key, (_, _, stored_at) in self._entries.items() if now - stored_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    @staticmethod
+    def _scope(context):
+        return hashlib.sha1((context or "").encode("utf-8")).hexdigest()
+
+    def _similar_key(self, vector, scope):
+        if self._matrix is None:
+            keys = list(self._entries)
+            self._matrix = (
+                keys,
+                np.array([k[0] for k in keys], dtype=object),
+                np.stack([self._entries[k][1] for k in keys]) if keys else None,
+            )
+        keys, scopes, vectors = self._matrix
+        if not keys:
+            return None
+        scores = np.where(scopes == scope, vectors @ vector, -np.inf)
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.threshold else None
+
+    def get(self, question, context=""):
+        """Cached answer for `question` asked with `context`, or None. Counts a hit or a miss."""
+        question_key = normalise_question(question)
+        if not question_key:
+            return None
+        scope = self._scope(context)
+        key = (scope, question_key)
+        with self._lock:
+            self._expire(time.monotonic())
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            if not self._entries:
+                self.misses += 1
+                return None
+        # Embedding takes milliseconds; do not hold the lock for it
+        vector = self._embed(question_key)
+        with self._lock:
+            similar = self._similar_key(vector, scope)
+            if similar is None or similar not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(similar)
+            self.semantic_hits += 1
+            return self._entries[similar][0]
+
+    def put(self, question, response, context=""):
+        question_key = normalise_question(question)
+        if not question_key or not response:
+            return
+        key = (self._scope(context), question_key)
+        vector = self._embed(question_key)
+        with self._lock:
+            self._entries[key] = (response, vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            entries, hits, semantic_hits, misses = len(self._entries), self.hits, self.semantic_hits, self.misses
+        lookups = hits + semantic_hits + misses
+        return {
+            "entries": entries,
+            "hits": hits,
+            "semantic_hits": semantic_hits,
+            "misses": misses,
+            "hit_rate": (hits + semantic_hits) / lookups if lookups else 0.0,
+        }
+
+@st.cache_resource
+def get_response_cache(_embedder):
+    return ResponseCache(_embedder)
@@ -0,0 +1,96 @@
+import os
+import re
+from typing import Any, List
+from langchain_core.memory import BaseMemory
+from langchain_core.pydantic_v1 import Field
+
+# ---------------- Configuration ------------------
+# Most the history may take; history_budget() lowers it to what the model's context leaves over
+HISTORY_TOKEN_BUDGET = int(os.getenv("LULU_HISTORY_TOKENS", "320"))
+# Room kept for the user's message; a longer one takes the excess from the manual extracts
+INPUT_TOKEN_BUDGET = 96
+SUMMARY_TOKEN_BUDGET = 96
+SUMMARY_LINE_TOKENS = 24
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+SUMMARY_PREFIX = "Earlier:"
+
+# ---------------- Prompt Budget ------------------
+def history_budget(tokenizer, template, context_size, reply_tokens, context_tokens, input_tokens=INPUT_TOKEN_BUDGET):
+    """
+    Tokens {chat_history} may take so the rendered `template` plus the reply fit in
+    `context_size`: what is left once the template itself (measured with the
+    tokenizer, slots empty), the reply, {context} and {input} have their share.
+    Never more than HISTORY_TOKEN_BUDGET.
+    """
+    fixed = len(tokenizer.encode(template.format(context="", chat_history="", input="")))
+    return max(min(context_size - fixed - reply_tokens - context_tokens - input_tokens, HISTORY_TOKEN_BUDGET), 0)
+
+# ---------------- Token-Budgeted Conversation Memory ------------------
+class TokenBudgetMemory(BaseMemory):
+    """
+    Conversation history for the prompt's {chat_history} slot that never grows
+    past `max_tokens`, counted with the model's own tokenizer.
+
+    Recent turns are kept verbatim in a sliding window. Turns that fall out of
+    the window are compressed into a rolling summary line (their first sentence,
+    capped at SUMMARY_LINE_TOKENS) and the oldest summary lines are dropped once
+    the summary passes `summary_tokens`. Every line is tokenised once, when it is
+    saved, so building the prompt costs no tokenisation at all.
+    """
+
+    tokenizer: Any
+    max_tokens: int = HISTORY_TOKEN_BUDGET
+    summary_tokens: int = SUMMARY_TOKEN_BUDGET
+    memory_key: str = "chat_history"
+    input_key: str = "input"
+    output_key: str = "response"
+    human_prefix: str = "Human"
+    ai_prefix: str = "Assistant"
+    window: List[Any] = Field(default_factory=list)     # [(line, token count)], oldest first
+    summary: List[Any] = Field(default_factory=list)    # [(line, token count)], oldest first
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def _count(self, text):
+        return len(self.tokenizer.encode(text))
+
+    def _truncate(self, text, max_tokens, separator):
+        """(text, token count) with the count including the separator it will be joined with."""
+        ids = self.tokenizer.encode(text)
+        if len(ids) > max_tokens:
+            text = self.tokenizer.decode(ids[:max_tokens - self._count("…")]).rstrip() + "…"
+        return text, self._count(separator + text)
+
+    def _tokens(self, lines):
+        return sum(count for _, count in lines)
+
+    def used_tokens(self):
+        summary = self._tokens(self.summary) + self._count(SUMMARY_PREFIX) if self.summary else 0
+        return self._tokens(self.window) + summary
+
+    def load_memory_variables(self, inputs):
+        lines = [line for line, _ in self.window]
+        if self.summary:
+            lines.insert(0, SUMMARY_PREFIX + "".join(" " + line for line, _ in self.summary))
+        return {self.memory_key: "\n".join(lines)}
+
+    def save_context(self, inputs, outputs):
+        # A single message may take at most half the budget, so the latest exchange always fits
+        for prefix, text in ((self.human_prefix, inputs[self.input_key]), (self.ai_prefix, outputs[self.output_key])):
+            self.window.append(self._truncate(f"{prefix}: {text.strip()}", self.max_tokens // 2 - 2, "\n"))
+
+        while self.used_tokens() > self.max_tokens and len(self.window) > 2:
+            line, _ = self.window.pop(0)
+            first_sentence = _SENTENCE_END.split(line, maxsplit=1)[0]
+            self.summary.append(self._truncate(first_sentence, SUMMARY_LINE_TOKENS, " "))
+            while self.summary and self._tokens(self.summary) > self.summary_tokens:
+                self.summary.pop(0)
+        while self.used_tokens() > self.max_tokens and self.summary:
+            self.summary.pop(0)
+
+    def clear(self):
+        self.window.clear()
+        self.summary.clear()
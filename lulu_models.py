@@ -0,0 +1,156 @@
+import inspect
+import os
+from typing import List
+import numpy as np
+import torch
+import transformers
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFacePipeline
+from transformers import AutoModel, AutoModelForCausalLM, AutoTokenizer
+from transformers.pytorch_utils import Conv1D
+
+# ---------------- Configuration ------------------
+TEXT_MODEL_HF = "gpt2"
+EMBED_MODEL_HF = "sentence-transformers/all-MiniLM-L6-v2"
+# The sentence-transformers model truncates at 256 tokens; the onnx path must too for identical vectors
+EMBED_MAX_TOKENS = 256
+# "torch" (fp32), "int8" (dynamic int8 quantisation of the linear layers) or "stub" (canned replies, see lulu_stub.py)
+TEXT_BACKEND = os.getenv("LULU_TEXT_BACKEND", "torch")
+# "torch" (sentence-transformers), "onnx" (onnxruntime, exported on first use) or "stub" (hashed trigrams)
+EMBED_BACKEND = os.getenv("LULU_EMBED_BACKEND", "torch")
+# Threads for PyTorch and onnxruntime; 0 keeps the libraries' own default
+INFERENCE_THREADS = int(os.getenv("LULU_THREADS", "0"))
+# Pre-downloaded weights; when set, nothing is ever fetched from the network
+MODEL_DIR = os.getenv("LULU_MODEL_DIR") or None
+
+TEXT_BACKENDS = ("torch", "int8", "stub")
+EMBED_BACKENDS = ("torch", "onnx", "stub")
+
+def _pretrained_kwargs(model_dir=MODEL_DIR):
+    return {"cache_dir": model_dir, "local_files_only": True} if model_dir else {}
+
+def configure_threads(threads=INFERENCE_THREADS):
+    if threads > 0:
+        torch.set_num_threads(threads)
+
+# ---------------- Text Generation ------------------
+def _conv1d_to_linear(module):
+    """GPT-2 uses Conv1D (a transposed Linear), which quantize_dynamic does not touch; swap in real Linears."""
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            linear = torch.nn.Linear(child.weight.shape[0], child.weight.shape[1])
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+def load_text_model(backend=TEXT_BACKEND, model_dir=MODEL_DIR):
+    """GPT-2 and its tokenizer, in fp32 or with int8 dynamically quantised linear layers (or the offline stub)."""
+    if backend not in TEXT_BACKENDS:
+        raise ValueError(f"Unknown text backend {backend!r}; expected one of {TEXT_BACKENDS}")
+    if backend == "stub":
+        from lulu_stub import load_stub_text_model
+        return load_stub_text_model()
+    tokenizer = AutoTokenizer.from_pretrained(TEXT_MODEL_HF, **_pretrained_kwargs(model_dir))
+    model = AutoModelForCausalLM.from_pretrained(TEXT_MODEL_HF, **_pretrained_kwargs(model_dir)).eval()
+    if backend == "int8":
+        _conv1d_to_linear(model)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model, tokenizer
+
+def build_llm(model, tokenizer):
+    """Wraps the model in the text-generation pipeline Lulu's chain uses."""
+    # "hole" keeps the end of an over-long prompt, as the batch worker does; it reads the limit from the tokenizer
+    tokenizer.model_max_length = min(tokenizer.model_max_length, getattr(model.config, "n_positions", 1024))
+    hf_pipeline = transformers.pipeline(
+        "text-generation",
+        model=model,
+        tokenizer=tokenizer,
+        max_new_tokens=200, # Limit output length to prevent very long responses
+        handle_long_generation="hole",
+        do_sample=True,
+        temperature=0.7,
+        pad_token_id=tokenizer.eos_token_id,
+    )
+    return HuggingFacePipeline(pipeline=hf_pipeline)
+
+# ---------------- Embeddings ------------------
+class OnnxEmbeddings(Embeddings):
+    """
+    all-MiniLM-L6-v2 on onnxruntime: mean pooling plus L2 normalisation, the same
+    head the sentence-transformers model uses. The graph is exported from the
+    PyTorch weights once and reused from `<model_dir>/onnx/` afterwards.
+    """
+
+    def __init__(self, model_name=EMBED_MODEL_HF, model_dir=MODEL_DIR, threads=INFERENCE_THREADS, batch_size=64):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The onnx embedding backend needs the onnxruntime package") from e
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, **_pretrained_kwargs(model_dir))
+        self.batch_size = batch_size
+        path = os.path.join(model_dir or os.path.join(os.path.expanduser("~"), ".cache", "lulu"), "onnx",
+                            model_name.replace("/", "--") + ".onnx")
+        if not os.path.exists(path):
+            self._export(model_name, model_dir, path)
+        options = onnxruntime.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _export(self, model_name, model_dir, path):
+        model = AutoModel.from_pretrained(model_name, **_pretrained_kwargs(model_dir)).eval()
+        sample = self.tokenizer(["export"], return_tensors="pt")
+        # Graph inputs follow forward()'s signature order, so name them in that order
+        names = [n for n in inspect.signature(model.forward).parameters if n in sample]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                model, ({n: sample[n] for n in names},), tmp_path,
+                input_names=names, output_names=["last_hidden_state"],
+                dynamic_axes={n: {0: "batch", 1: "sequence"} for n in names + ["last_hidden_state"]},
+                opset_version=14,
+            )
+        os.replace(tmp_path, path)
+
+    def _embed(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = self.tokenizer(texts[start:start + self.batch_size], padding=True, truncation=True,
+                                   max_length=EMBED_MAX_TOKENS, return_tensors="np")
+            feeds = {name: value.astype(np.int64) for name, value in batch.items() if name in self._input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = batch["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            vectors.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        return np.concatenate(vectors).tolist() if vectors else []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+def load_embedder(backend=EMBED_BACKEND, model_dir=MODEL_DIR):
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {EMBED_BACKENDS}")
+    if backend == "onnx":
+        return OnnxEmbeddings(model_dir=model_dir)
+    if backend == "stub":
+        from lulu_stub import StubEmbeddings
+        return StubEmbeddings()
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    model_name = EMBED_MODEL_HF
+    if model_dir:
+        # sentence-transformers tries the Hub before its cache; hand it the local snapshot instead
+        from huggingface_hub import snapshot_download
+        model_name = snapshot_download(EMBED_MODEL_HF, cache_dir=model_dir, local_files_only=True)
+    return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": 64})
+
+def load_models(text_backend=TEXT_BACKEND, embed_backend=EMBED_BACKEND, model_dir=MODEL_DIR, threads=INFERENCE_THREADS):
+    """(llm, embedder) for the selected backends."""
+    configure_threads(threads)
+    return build_llm(*load_text_model(text_backend, model_dir)), load_embedder(embed_backend, model_dir)
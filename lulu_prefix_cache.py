@@ -0,0 +1,54 @@
+import torch
+import streamlit as st
+
+# ---------------- Prefix Text ------------------
+def static_prefix(template):
+    """
+    The part of a prompt template before its first {variable}, without trailing
+    whitespace: GPT-2 merges whitespace runs into one token, so the prefix only
+    tokenises the same alone as at the start of a prompt if it ends on a word.
+    """
+    return template.split("{", 1)[0].rstrip()
+
+# ---------------- Prefix KV Cache ------------------
+class PrefixCache:
+    """
+    The model's key/value state for the constant start of every prompt (Lulu's
+    persona), computed once. A prompt that starts with `text` then only needs its
+    remaining tokens run through the model: generate() gets the full input ids
+    plus these past_key_values and skips the tokens they already cover.
+    """
+
+    def __init__(self, model, tokenizer, text):
+        self.text = text
+        self.tokenizer = tokenizer
+        self.ids = tokenizer.encode(text)
+        with torch.no_grad():
+            self.past_key_values = model(torch.tensor([self.ids]), use_cache=True).past_key_values
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rest_ids(self, prompt):
+        """Token ids of the prompt after the prefix, or None when the prompt does not start with it."""
+        if not prompt.startswith(self.text):
+            return None
+        return self.tokenizer.encode(prompt[len(self.text):])
+
+    def past_for(self, batch_size):
+        """The cached state broadcast over a batch; views, so nothing is copied."""
+        return tuple(
+            tuple(tensor.expand(batch_size, *tensor.shape[1:]) for tensor in layer)
+            for layer in self.past_key_values
+        )
+
+def build_prefix_cache(model, tokenizer, text):
+    """A PrefixCache, or None when there is no prefix or the model keeps no KV cache (e.g. the stub)."""
+    if not text or not getattr(model.config, "use_cache", False):
+        return None
+    return PrefixCache(model, tokenizer, text)
+
+@st.cache_resource
+def get_prefix_cache(_llm, text):
+    """Process-wide cache of the persona prefix for the loaded text model."""
+    return build_prefix_cache(_llm.pipeline.model, _llm.pipeline.tokenizer, text)
@@ -0,0 +1,43 @@
+import re
+import time
+from contextlib import contextmanager
+
+ASSISTANT_TAG = "Assistant:"
+_THOUGHT = re.compile(r"<think>(.*?)</think>", re.DOTALL)
+
+# ---------------- Response Parsing ------------------
+def extract_reply(result):
+    """
+    Lulu's reply from what the chain returned: ConversationChain's dict, the
+    pipeline's [{"generated_text": ...}] list, or anything else (stringified).
+    Only the text after the last "Assistant:" is kept.
+    """
+    if isinstance(result, dict) and "response" in result:
+        # ConversationChain returns its inputs plus the generated text under 'response'
+        result = [{"generated_text": result["response"]}]
+    if not (isinstance(result, list) and result and "generated_text" in result[0]):
+        return str(result)  # fallback for unexpected output structure
+    # Fallback to the whole text if "Assistant:" isn't found (unlikely if the template is consistent)
+    return result[0]["generated_text"].rsplit(ASSISTANT_TAG, 1)[-1].strip()
+
+def parse_thoughts(response_text):
+    """(thought, cleaned response) for text with a <think>...</think> block, else (None, response_text)."""
+    match = _THOUGHT.search(response_text)
+    if match:
+        return match.group(1).strip(), _THOUGHT.sub("", response_text).strip()
+    return None, response_text
+
+# ---------------- Turn Timing ------------------
+class StageTimer:
+    """Wall time per named stage of one chat turn; bench_chat.py reports these."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
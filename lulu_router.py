@@ -0,0 +1,147 @@
+import re
+import zlib
+from functools import lru_cache
+import numpy as np
+import streamlit as st
+
+# ---------------- Configuration ------------------
+# Example utterances per intent. "chat" is everything Lulu should answer with the model.
+ROUTE_EXAMPLES = {
+    "shop": [
+        "where is the nearest airtel shop",
+        "shop near me",
+        "which shop is open now",
+        "find the kakamega shop",
+        "airtel shop in westlands",
+        "where can I find an airtel shop in nakuru",
+        "location of the eldoret shop",
+        "shop opening hours",
+        "what time does the mombasa shop close",
+        "directions to the nearest shop",
+        "nearest shop to -1.2921, 36.8219",
+        "shops open near 0.5143, 35.2698",
+        "which shops are open tomorrow at 9am",
+        "open saturday 10am",
+    ],
+    "ticket": [
+        "follow up on ticket",
+        "what is the status of my ticket",
+        "has my ticket been resolved",
+        "check ticket status",
+        "who is handling ticket 3fa9c2d1",
+        "is my ticket escalated",
+        "open tickets for agent 0733123456",
+        "any update on the float ticket",
+        "my complaint has not been fixed",
+        "ticket follow up",
+        "what is the status of ticket #3fa9c2d1",
+        "is ticket 7b2e4f90 closed",
+    ],
+    "leave": [
+        "how many leave days do I have left",
+        "what is my leave balance",
+        "remaining annual leave",
+        "how much leave have I used",
+        "leave days left",
+        "can I take leave next week",
+        "how many days off do I have",
+        "my leave balance please",
+    ],
+    "chat": [
+        "how do I approve a kyc registration",
+        "the agent's float transfer failed",
+        "what are the onboarding steps for a new agent",
+        "kyc approval",
+        "float issues",
+        "onboarding steps",
+        "how is commission calculated",
+        "how do I reset an agent pin",
+        "what documents are needed for a sim swap",
+        "hello lulu",
+        "thank you",
+        "explain the airtel money tariff",
+        # "How do I ..." questions about shops, tickets and leave are for the model, not a lookup
+        "how do I escalate a ticket",
+        "how do I raise a ticket for an agent",
+        "how do I sell more at the shop",
+        "how do I open a new shop",
+        "my agent wants to leave airtel, how do I offboard them",
+        "an agent is leaving, what is the offboarding process",
+        "where do I take my leave form",
+        "how do I apply for leave",
+        "what is the leave policy",
+    ],
+}
+FALLBACK_INTENT = "chat"
+# Below this cosine similarity to its nearest intent, or this margin over the runner-up, a message goes to the model
+MIN_ROUTE_SCORE = 0.3
+MIN_ROUTE_MARGIN = 0.1
+HASH_DIMENSIONS = 2 ** 14
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_CLOCK = re.compile(r"\d{1,2}(am|pm)")
+
+# ---------------- Features ------------------
+def _bucket(feature):
+    # crc32 rather than hash(): routing must not change between processes
+    return zlib.crc32(feature.encode("utf-8")) % HASH_DIMENSIONS
+
+def _word(token):
+    # Numbers, times ('9am') and ticket ids ('3fa9c2d1') each share one feature, so they do not look alike
+    if token.isdigit():
+        return "<num>"
+    if _CLOCK.fullmatch(token):
+        return "<time>"
+    return "<id>" if any(c.isdigit() for c in token) else token
+
+def features(text):
+    """Hashed word unigrams, word bigrams and character trigrams of `text`, as (buckets, L2-normalised weights)."""
+    words = [_word(w) for w in _TOKEN.findall(text.lower())]
+    grams = [f"w:{w}" for w in words] + [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    if not grams:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    buckets, counts = np.unique([_bucket(g) for g in grams], return_counts=True)
+    weights = counts.astype(np.float32)
+    return buckets, weights / np.linalg.norm(weights)
+
+# ---------------- Nearest-Centroid Router ------------------
+class IntentRouter:
+    """
+    Sends each message to an intent by cosine similarity to the mean feature
+    vector of that intent's examples. Centroids are computed once; routing a
+    message only hashes its n-grams and reads a few columns of the centroid
+    matrix, so it costs well under a millisecond and needs no model.
+    """
+
+    def __init__(self, examples=ROUTE_EXAMPLES, min_score=MIN_ROUTE_SCORE, min_margin=MIN_ROUTE_MARGIN):
+        self.intents = list(examples)
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.centroids = np.zeros((len(self.intents), HASH_DIMENSIONS), dtype=np.float32)
+        for row, intent in enumerate(self.intents):
+            for text in examples[intent]:
+                buckets, weights = features(text)
+                self.centroids[row, buckets] += weights
+            self.centroids[row] /= max(np.linalg.norm(self.centroids[row]), 1e-12)
+        # Per instance, so the cache goes away with the router
+        self.route = lru_cache(maxsize=1024)(self._route)
+
+    def scores(self, text):
+        buckets, weights = features(text)
+        return dict(zip(self.intents, (self.centroids[:, buckets] @ weights).tolist()))
+
+    def _route(self, text):
+        """(intent, score); FALLBACK_INTENT unless one intent wins clearly."""
+        ranked = sorted(self.scores(text).items(), key=lambda item: item[1], reverse=True)
+        (intent, score), runner_up = ranked[0], ranked[1][1] if len(ranked) > 1 else 0.0
+        if score < self.min_score or score - runner_up < self.min_margin:
+            return FALLBACK_INTENT, score
+        return intent, score
+
+@st.cache_resource
+def get_intent_router():
+    """The process-wide router; centroids are built on first use."""
+    return IntentRouter()
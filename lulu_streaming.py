@@ -0,0 +1,134 @@
+import threading
+import time
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+# ---------------- Configuration ------------------
+# GPT-2 happily writes the next "Human:" turn itself; cut the reply there
+STOP_SEQUENCES = ["\nHuman:", "Human:"]
+
+class _CountingStreamer(TextIteratorStreamer):
+    """TextIteratorStreamer that also records when the first new token arrived and how many followed."""
+
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.token_count = 0
+        self.first_token_at = None
+
+    def put(self, value):
+        if not (self.skip_prompt and self.next_tokens_are_prompt):
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.token_count += value.numel()
+        super().put(value)
+
+class _StopWhenSet(StoppingCriteria):
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+# ---------------- Streaming Generation ------------------
+class StreamingGeneration:
+    """
+    Runs model.generate on a background thread and yields the reply text piece by
+    piece as tokens are produced, e.g. into st.write_stream.
+
+    Iteration stops at the first stop sequence and tells the generator thread to
+    stop too. Afterwards `text` holds the final reply and `stats()` the timings.
+    If generation fails, the text produced so far is yielded and the error is
+    then raised from the iteration, like BatchedGeneration does.
+    """
+
+    def __init__(self, hf_pipeline, prompt, stop_sequences=STOP_SEQUENCES, timeout=120, prefix_cache=None, **generate_kwargs):
+        self.tokenizer = hf_pipeline.tokenizer
+        self.model = hf_pipeline.model
+        self.prompt = prompt
+        self.prefix_cache = prefix_cache
+        self.stop_sequences = stop_sequences
+        self.text = ""
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self._stop = threading.Event()
+        self._streamer = _CountingStreamer(
+            self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=timeout
+        )
+        # Same sampling settings the non-streaming pipeline was built with, unless overridden
+        self.generate_kwargs = {
+            "max_new_tokens": 200,
+            "do_sample": True,
+            "temperature": 0.7,
+            "pad_token_id": self.tokenizer.eos_token_id,
+            **generate_kwargs,
+        }
+
+    def _generate(self, inputs):
+        try:
+            self.model.generate(
+                **inputs,
+                streamer=self._streamer,
+                stopping_criteria=StoppingCriteriaList([_StopWhenSet(self._stop)]),
+                **self.generate_kwargs,
+            )
+        except Exception as e:
+            # Unblock the consumer and hand it the error to raise on its own thread
+            self.error = e
+            self._streamer.end()
+
+    def _inputs(self):
+        # Prompt and reply must fit the model's context; truncated as InferenceService.submit does
+        context_size = getattr(self.model.config, "n_positions", 1024)
+        max_new_tokens = self.generate_kwargs["max_new_tokens"] = min(self.generate_kwargs["max_new_tokens"], context_size - 1)
+        rest_ids = self.prefix_cache.rest_ids(self.prompt) if self.prefix_cache else None
+        budget = context_size - max_new_tokens - (len(self.prefix_cache) if self.prefix_cache else 0)
+        if rest_ids is None or budget <= 0:
+            # Keep the end of an over-long prompt: the question and latest turns matter most
+            input_ids = torch.tensor([self.tokenizer.encode(self.prompt)[-(context_size - max_new_tokens):]])
+            return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+        # Only the tokens after the cached persona prefix go through the model
+        input_ids = torch.tensor([self.prefix_cache.ids + rest_ids[-budget:]])
+        return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids),
+                "past_key_values": self.prefix_cache.past_for(1)}
+
+    def __iter__(self):
+        self.started_at = time.perf_counter()
+        inputs = self._inputs()
+        thread = threading.Thread(target=self._generate, args=(inputs,), daemon=True)
+        thread.start()
+
+        emitted = 0
+        for piece in self._streamer:
+            self.text += piece
+            stop_at = min((i for i in (self.text.find(s) for s in self.stop_sequences) if i >= 0), default=-1)
+            if stop_at >= 0:
+                self.text = self.text[:stop_at]
+                self._stop.set()
+            # Hold back a few characters that could be the start of a stop sequence
+            safe = len(self.text) if stop_at >= 0 else max(emitted, len(self.text) - max(map(len, self.stop_sequences)))
+            if safe > emitted:
+                yield self.text[emitted:safe]
+                emitted = safe
+            if stop_at >= 0:
+                break
+
+        if emitted < len(self.text):
+            yield self.text[emitted:]
+        self.text = self.text.strip()
+        self.finished_at = time.perf_counter()
+        thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        """Time to first token and decode speed of the finished generation."""
+        streamer = self._streamer
+        if self.finished_at is None or streamer.first_token_at is None:
+            return {"time_to_first_token": None, "tokens": streamer.token_count, "tokens_per_second": None}
+        decode_time = self.finished_at - streamer.first_token_at
+        return {
+            "time_to_first_token": streamer.first_token_at - self.started_at,
+            "tokens": streamer.token_count,
+            "tokens_per_second": (streamer.token_count - 1) / decode_time if decode_time > 0 else None,
+        }
@@ -0,0 +1,84 @@
+import zlib
+from typing import List
+import numpy as np
+import torch
+from langchain_core.embeddings import Embeddings
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+from transformers.modeling_outputs import CausalLMOutputWithCrossAttentions
+
+# ---------------- Configuration ------------------
+# What the stub model always answers; deterministic, so benchmark runs are comparable
+STUB_REPLY = " Sure. Check the agent's float balance first, then raise a ticket if it is still failing."
+# Byte-level tokens run about four to a GPT-2 token, so the same prompt needs four times the positions
+STUB_CONTEXT_SIZE = 4 * 1024
+STUB_EMBED_DIMENSIONS = 384
+EOS_TOKEN = "<|endoftext|>"
+
+# ---------------- Tokenizer ------------------
+def load_stub_tokenizer():
+    """A byte-level tokenizer (one token per byte, like GPT-2 before merges) that needs no download."""
+    vocab = {char: i for i, char in enumerate(sorted(pre_tokenizers.ByteLevel.alphabet()))}
+    vocab[EOS_TOKEN] = len(vocab)
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.add_special_tokens([EOS_TOKEN])
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token=EOS_TOKEN, bos_token=EOS_TOKEN, unk_token=EOS_TOKEN,
+                                   model_input_names=["input_ids", "attention_mask"])
+
+# ---------------- Model ------------------
+class StubLM(GPT2LMHeadModel):
+    """
+    GPT-2 shaped model that skips the transformer and always writes STUB_REPLY.
+
+    Each row continues the reply from however much of it already ends the row,
+    then emits EOS, so it behaves the same for single, streamed and left-padded
+    batched generation. It keeps no KV cache: every step sees the whole sequence.
+    """
+
+    def __init__(self, config, reply_ids):
+        super().__init__(config)
+        self.reply_ids = list(reply_ids)
+
+    def _next_token(self, ids):
+        for done in range(min(len(self.reply_ids), len(ids)), 0, -1):
+            if ids[-done:] == self.reply_ids[:done]:
+                return self.reply_ids[done] if done < len(self.reply_ids) else self.config.eos_token_id
+        return self.reply_ids[0]
+
+    def forward(self, input_ids=None, past_key_values=None, attention_mask=None, position_ids=None, **kwargs):
+        logits = torch.full((*input_ids.shape, self.config.vocab_size), -1e4, device=input_ids.device)
+        # Only the tail can hold part of the reply
+        for row, ids in enumerate(input_ids[:, -len(self.reply_ids):].tolist()):
+            logits[row, -1, self._next_token(ids)] = 0.0
+        return CausalLMOutputWithCrossAttentions(logits=logits)
+
+def load_stub_text_model():
+    """(model, tokenizer) for the "stub" text backend; nothing is downloaded."""
+    tokenizer = load_stub_tokenizer()
+    config = GPT2Config(
+        vocab_size=len(tokenizer), n_positions=STUB_CONTEXT_SIZE, n_embd=8, n_layer=1, n_head=1,
+        bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id, use_cache=False,
+    )
+    return StubLM(config, tokenizer.encode(STUB_REPLY)).eval(), tokenizer
+
+# ---------------- Embeddings ------------------
+class StubEmbeddings(Embeddings):
+    """Hashed character trigrams, L2-normalised; similar texts get similar vectors, with no model."""
+
+    def __init__(self, dimensions=STUB_EMBED_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        padded = f"  {text.lower()} "
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(padded[i:i + 3].encode("utf-8")) % self.dimensions] += 1
+        return (vector / max(np.linalg.norm(vector), 1e-12)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
@@ -0,0 +1,351 @@
+import sys
+import sqlite3
+from datetime import datetime
+from tickets import TICKET_COLUMNS, TIMESTAMP_FORMAT, create_ticket_stats, normalise_msisdn
+from ticket_dedupe import backfill_index
+
+# ---------------- Canonical Schema ------------------
+TICKETS_TABLE_SQL = """
+    CREATE TABLE channel_partners_tickets (
+        ticket_id TEXT PRIMARY KEY,
+        agent_msisdn TEXT,
+        issue_text TEXT,
+        issue_tag TEXT,
+        status TEXT,
+        level TEXT,
+        assigned_to TEXT,
+        image_path TEXT,
+        created_at TEXT,
+        last_updated TEXT
+    )
+"""
+
+# Columns of the original hand-built table and the canonical column they feed.
+# Rows without any id get a random 8-character id like the ones the form generates.
+LEGACY_TICKET_COLUMNS = {
+    "ticket_id": ["ticket_id", "tid"],
+    "agent_msisdn": ["agent_msisdn", "msisdn"],
+    "created_at": ["created_at", "time_stamp"],
+    "last_updated": ["last_updated", "created_at", "time_stamp"],
+}
+TICKET_DEFAULTS = {
+    "ticket_id": "lower(hex(randomblob(4)))",
+    "status": "'Open'",
+    "level": "'L0'",
+}
+
+def _table_columns(conn, table):
+    return {row[1]: row for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _legacy_expression(column, existing):
+    sources = [
+        f"CAST(NULLIF({source}, '') AS TEXT)"
+        for source in LEGACY_TICKET_COLUMNS.get(column, [column])
+        if source in existing
+    ]
+    if column in TICKET_DEFAULTS:
+        sources.append(TICKET_DEFAULTS[column])
+    if not sources:
+        return "NULL"
+    return sources[0] if len(sources) == 1 else f"COALESCE({', '.join(sources)})"
+
+# ---------------- Migrations ------------------
+def _canonical_tickets_table(conn):
+    existing = _table_columns(conn, "channel_partners_tickets")
+    if not existing:
+        conn.execute(TICKETS_TABLE_SQL)
+    elif set(existing) != set(TICKET_COLUMNS) or not existing["ticket_id"][5]:
+        # Legacy layout (msisdn / tid / fp_msisdn, no primary key): rebuild and copy rows across
+        select = ", ".join(_legacy_expression(column, existing) for column in TICKET_COLUMNS)
+        conn.execute("ALTER TABLE channel_partners_tickets RENAME TO channel_partners_tickets_legacy")
+        conn.execute(TICKETS_TABLE_SQL)
+        conn.execute(f"""
+            INSERT OR IGNORE INTO channel_partners_tickets ({', '.join(TICKET_COLUMNS)})
+            SELECT {select} FROM channel_partners_tickets_legacy
+        """)
+        conn.execute("DROP TABLE channel_partners_tickets_legacy")
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS se_users (
+            auuid INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            surname TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone_number INTEGER NOT NULL,
+            Department TEXT NOT NULL,
+            Reporting_To TEXT NOT NULL,
+            Occupation TEXT NOT NULL,
+            PRIMARY KEY (auuid)
+        )
+    """)
+
+def _ticket_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_status_level ON channel_partners_tickets (status, level)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_last_updated ON channel_partners_tickets (last_updated, ticket_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_agent_msisdn ON channel_partners_tickets (agent_msisdn)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_issue_tag ON channel_partners_tickets (issue_tag)")
+
+def _ocr_jobs_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_ocr_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id TEXT NOT NULL,
+            image_path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_jobs_due ON ticket_ocr_jobs (status, next_attempt_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_jobs_ticket ON ticket_ocr_jobs (ticket_id)")
+
+def _ticket_blobs_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_blobs (
+            digest TEXT PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            thumbnail_path TEXT,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+    """)
+    # Reference counts follow channel_partners_tickets.image_path inside the writer's transaction
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS ticket_blobs_ref_insert
+        AFTER INSERT ON channel_partners_tickets WHEN COALESCE(NEW.image_path, '') != ''
+        BEGIN UPDATE ticket_blobs SET refcount = refcount + 1 WHERE path = NEW.image_path; END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS ticket_blobs_ref_delete
+        AFTER DELETE ON channel_partners_tickets WHEN COALESCE(OLD.image_path, '') != ''
+        BEGIN UPDATE ticket_blobs SET refcount = refcount - 1 WHERE path = OLD.image_path; END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS ticket_blobs_ref_update
+        AFTER UPDATE OF image_path ON channel_partners_tickets WHEN OLD.image_path IS NOT NEW.image_path
+        BEGIN
+            UPDATE ticket_blobs SET refcount = refcount - 1 WHERE path = OLD.image_path;
+            UPDATE ticket_blobs SET refcount = refcount + 1 WHERE path = NEW.image_path;
+        END
+    """)
+
+def _agent_regions_table(conn):
+    # Region per agent line, used by the ticket routing rules
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agent_regions (
+            agent_msisdn TEXT PRIMARY KEY,
+            region TEXT NOT NULL
+        )
+    """)
+
+def _ticket_search_index(conn):
+    # External-content FTS5 index over issue_text, keyed on the tickets table's rowid.
+    # VACUUM can renumber rowids; run ticket_search.rebuild_search_index() afterwards.
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS channel_partners_tickets_fts USING fts5(
+            issue_text,
+            content='channel_partners_tickets',
+            content_rowid='rowid',
+            tokenize='porter unicode61'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS channel_partners_tickets_fts_insert
+        AFTER INSERT ON channel_partners_tickets
+        BEGIN
+            INSERT INTO channel_partners_tickets_fts (rowid, issue_text) VALUES (NEW.rowid, NEW.issue_text);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS channel_partners_tickets_fts_delete
+        AFTER DELETE ON channel_partners_tickets
+        BEGIN
+            INSERT INTO channel_partners_tickets_fts (channel_partners_tickets_fts, rowid, issue_text)
+            VALUES ('delete', OLD.rowid, OLD.issue_text);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS channel_partners_tickets_fts_update
+        AFTER UPDATE OF issue_text ON channel_partners_tickets
+        BEGIN
+            INSERT INTO channel_partners_tickets_fts (channel_partners_tickets_fts, rowid, issue_text)
+            VALUES ('delete', OLD.rowid, OLD.issue_text);
+            INSERT INTO channel_partners_tickets_fts (rowid, issue_text) VALUES (NEW.rowid, NEW.issue_text);
+        END
+    """)
+    conn.execute("INSERT INTO channel_partners_tickets_fts (channel_partners_tickets_fts) VALUES ('rebuild')")
+
+def _ticket_minhash_index(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_minhash (
+            ticket_id TEXT PRIMARY KEY,
+            agent_msisdn TEXT,
+            issue_tag TEXT,
+            signature BLOB NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ticket_minhash_agent_tag ON ticket_minhash (agent_msisdn, issue_tag)")
+    # Only open tickets are duplicate candidates: drop them on close/delete, follow agent and tag edits
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS ticket_minhash_close
+        AFTER UPDATE OF status ON channel_partners_tickets WHEN NEW.status = 'Closed'
+        BEGIN DELETE FROM ticket_minhash WHERE ticket_id = NEW.ticket_id; END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS ticket_minhash_delete
+        AFTER DELETE ON channel_partners_tickets
+        BEGIN DELETE FROM ticket_minhash WHERE ticket_id = OLD.ticket_id; END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS ticket_minhash_retag
+        AFTER UPDATE OF agent_msisdn, issue_tag ON channel_partners_tickets
+        BEGIN
+            UPDATE ticket_minhash SET agent_msisdn = NEW.agent_msisdn, issue_tag = NEW.issue_tag
+            WHERE ticket_id = NEW.ticket_id;
+        END
+    """)
+    backfill_index(conn)
+
+def _knowledge_base_tables(conn):
+    # Chunk text and provenance for the Lulu knowledge index; chunk_id is the FAISS id
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS kb_documents (
+            doc_id TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            pages INTEGER,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS kb_chunks (
+            chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            doc_id TEXT NOT NULL,
+            chunk_hash TEXT NOT NULL,
+            page INTEGER,
+            text TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_kb_chunks_doc ON kb_chunks (doc_id, chunk_hash)")
+
+def _chat_history_tables(conn):
+    # Append-only Lulu chat log; chat_sessions is a per-conversation summary kept by trigger
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages (session_id, message_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_user_time ON chat_messages (user_id, created_at, message_id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            session_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            last_message_at TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_recent ON chat_sessions (user_id, last_message_at, session_id)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS chat_sessions_on_message
+        AFTER INSERT ON chat_messages
+        BEGIN
+            INSERT INTO chat_sessions (session_id, user_id, title, started_at, last_message_at, message_count)
+            VALUES (NEW.session_id, NEW.user_id, substr(NEW.content, 1, 80), NEW.created_at, NEW.created_at, 1)
+            ON CONFLICT (session_id) DO UPDATE SET
+                last_message_at = NEW.created_at, message_count = message_count + 1;
+        END
+    """)
+
+def _agent_ticket_index(conn):
+    # An agent's tickets newest first, as the chatbot's ticket follow-up pages through them
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tickets_agent_recent
+        ON channel_partners_tickets (agent_msisdn, last_updated, ticket_id)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_tickets_agent_msisdn")  # a prefix of the new index
+
+def _normalised_minhash_msisdns(conn):
+    # Duplicate candidates are looked up by normalised MSISDN; rewrite signatures of older rows
+    rows = conn.execute("SELECT ticket_id, agent_msisdn FROM ticket_minhash").fetchall()
+    conn.executemany(
+        "UPDATE ticket_minhash SET agent_msisdn = ? WHERE ticket_id = ?",
+        [(normalise_msisdn(msisdn), ticket_id) for ticket_id, msisdn in rows
+         if normalise_msisdn(msisdn) not in (None, msisdn)],
+    )
+
+# Append new migrations at the end; never renumber or edit one that has shipped.
+MIGRATIONS = [
+    (1, "canonical channel_partners_tickets table", _canonical_tickets_table),
+    (2, "ticket secondary indexes", _ticket_indexes),
+    (3, "ticket summary table", create_ticket_stats),
+    (4, "ticket OCR job queue", _ocr_jobs_table),
+    (5, "content-addressed ticket images", _ticket_blobs_table),
+    (6, "agent regions for ticket routing", _agent_regions_table),
+    (7, "full-text search over ticket descriptions", _ticket_search_index),
+    (8, "near-duplicate ticket signatures", _ticket_minhash_index),
+    (9, "knowledge base chunks", _knowledge_base_tables),
+    (10, "persistent Lulu chat history", _chat_history_tables),
+    (11, "agent ticket history index", _agent_ticket_index),
+    (12, "normalised MSISDNs in duplicate signatures", _normalised_minhash_msisdns),
+]
+
+# ---------------- Runner ------------------
+def applied_versions(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+def migrate(conn):
+    """
+    Brings the database up to the latest schema version.
+
+    Each pending migration runs in its own IMMEDIATE transaction together with its
+    schema_migrations record, so a failed step leaves the database at the previous
+    version and concurrent processes never apply the same step twice.
+    Returns the list of versions applied by this call.
+    """
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version in applied_versions(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock in case another process got here first
+            if version not in applied_versions(conn):
+                step(conn)
+                conn.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                    (version, name, datetime.now().strftime(TIMESTAMP_FORMAT)),
+                )
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+if __name__ == "__main__":
+    # Usage: python migrations.py [path/to/database.db]
+    from db import DB_PATH
+    path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    conn = sqlite3.connect(path)
+    versions = migrate(conn)
+    print(f"Applied migrations: {versions}" if versions else "Database already up to date.")
+    conn.close()
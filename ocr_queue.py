@@ -0,0 +1,170 @@
+import logging
+import random
+import threading
+from datetime import datetime, timedelta
+import streamlit as st
+from db import get_db
+from tickets import TIMESTAMP_FORMAT
+from ticket_dedupe import index_ticket
+
+# ---------------- Configuration ------------------
+OCR_WORKERS = 2
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 600
+POLL_INTERVAL_SECONDS = 2.0
+# A job still 'running' this long after it was claimed lost its worker (crash or restart)
+JOB_LEASE = timedelta(minutes=10)
+
+logger = logging.getLogger(__name__)
+
+# -------------- Simulated OCR & MiniCPM-V Reasoning ------------------
+def minicipm_ocr_pipeline(image_bytes):
+    # Simulate OCR output from image
+    extracted_text = "Transaction failed due to insufficient float."
+    # Simulate reasoning/tagging by MiniCPM-V
+    description = extracted_text
+    tag = "Float"
+    return description, tag
+
+def _now():
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+# ---------------- Job Queue ------------------
+def enqueue_ocr_job(conn, ticket_id, image_path):
+    """
+    Queues a screenshot for OCR. Runs on the caller's transaction so the job is
+    committed together with the ticket it belongs to.
+    """
+    now = _now()
+    conn.execute("""
+        INSERT INTO ticket_ocr_jobs (ticket_id, image_path, status, next_attempt_at, created_at, updated_at)
+        VALUES (?, ?, 'queued', ?, ?, ?)
+    """, (ticket_id, image_path, now, now, now))
+
+def claim_next_job(conn, lease=JOB_LEASE):
+    """
+    Atomically marks the oldest due job as running and returns it, or None if nothing
+    is due. A running job whose lease has expired (claimed more than `lease` ago and
+    never finished) is due again, so jobs of a dead worker or process are picked up
+    without touching jobs other live workers hold.
+    """
+    now = datetime.now()
+    expired = (now - lease).strftime(TIMESTAMP_FORMAT)
+    now = now.strftime(TIMESTAMP_FORMAT)
+    with conn:
+        return conn.execute("""
+            UPDATE ticket_ocr_jobs
+            SET status = 'running', attempts = attempts + 1, updated_at = ?
+            WHERE job_id = (
+                SELECT job_id FROM ticket_ocr_jobs
+                WHERE (status = 'queued' AND next_attempt_at <= ?)
+                   OR (status = 'running' AND updated_at < ?)
+                ORDER BY next_attempt_at, job_id
+                LIMIT 1
+            )
+            RETURNING job_id, ticket_id, image_path, attempts
+        """, (now, now, expired)).fetchone()
+
+def complete_job(conn, job_id, ticket_id, description, tag):
+    """Writes the OCR result back to the ticket and closes the job in one transaction."""
+    now = _now()
+    with conn:
+        # Keep a description the agent typed; only fill it in when it was left blank
+        conn.execute("""
+            UPDATE channel_partners_tickets
+            SET issue_text = CASE WHEN COALESCE(issue_text, '') = '' THEN ? ELSE issue_text END,
+                issue_tag = ?, last_updated = ?
+            WHERE ticket_id = ?
+        """, (description, tag, now, ticket_id))
+        conn.execute(
+            "UPDATE ticket_ocr_jobs SET status = 'done', last_error = NULL, updated_at = ? WHERE job_id = ?",
+            (now, job_id),
+        )
+        # The description may have just been filled in, so refresh the duplicate signature
+        ticket = conn.execute(
+            "SELECT agent_msisdn, issue_tag, issue_text, status FROM channel_partners_tickets WHERE ticket_id = ?",
+            (ticket_id,),
+        ).fetchone()
+        if ticket and ticket[3] != "Closed":
+            index_ticket(conn, ticket_id, *ticket[:3])
+
+def fail_job(conn, job_id, attempts, error):
+    """Re-queues a failed job with exponential backoff and jitter, or gives up after MAX_ATTEMPTS."""
+    now = datetime.now()
+    if attempts >= MAX_ATTEMPTS:
+        status, next_attempt = "failed", now
+    else:
+        delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+        status, next_attempt = "queued", now + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+    with conn:
+        conn.execute("""
+            UPDATE ticket_ocr_jobs
+            SET status = ?, next_attempt_at = ?, last_error = ?, updated_at = ?
+            WHERE job_id = ?
+        """, (status, next_attempt.strftime(TIMESTAMP_FORMAT), str(error)[:500], now.strftime(TIMESTAMP_FORMAT), job_id))
+
+# ---------------- Worker Pool ------------------
+class OcrWorkerPool:
+    """
+    A fixed number of daemon threads draining ticket_ocr_jobs.
+
+    Workers poll for due jobs every POLL_INTERVAL_SECONDS and can be woken early
+    with notify() right after a job is enqueued. An error in one iteration (a
+    locked database, a failing write-back) is logged and the job handed back to
+    the queue; the worker carries on with the next one.
+    """
+
+    def __init__(self, db, workers=OCR_WORKERS, ocr=minicipm_ocr_pipeline):
+        self.db = db
+        self.ocr = ocr
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+        self.threads = [
+            threading.Thread(target=self._run, name=f"ocr-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        conn = self.db.connection()
+        try:
+            while not self._stop.is_set():
+                try:
+                    job = claim_next_job(conn)
+                except Exception:
+                    logger.exception("Could not claim an OCR job; retrying")
+                    job = None
+                if job is None:
+                    self._wake.wait(POLL_INTERVAL_SECONDS)
+                    self._wake.clear()
+                    continue
+                self._process(conn, *job)
+        finally:
+            self.db.close()
+
+    def _process(self, conn, job_id, ticket_id, image_path, attempts):
+        try:
+            with open(image_path, "rb") as f:
+                description, tag = self.ocr(f.read())
+            complete_job(conn, job_id, ticket_id, description, tag)
+        except Exception as e:
+            logger.warning("OCR job %s for ticket %s failed (attempt %s): %s", job_id, ticket_id, attempts, e)
+            try:
+                fail_job(conn, job_id, attempts, e)
+            except Exception:
+                # The job stays 'running' and is picked up again once its lease expires
+                logger.exception("Could not requeue OCR job %s", job_id)
+
+@st.cache_resource
+def get_ocr_workers():
+    return OcrWorkerPool(get_db())
@@ -0,0 +1,195 @@
+import json
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from functools import cached_property
+import numpy as np
+import streamlit as st
+
+# ---------------- Configuration ------------------
+# Shipped next to the code; LULU_SHOP_CATALOGUE points elsewhere (e.g. a mounted volume)
+SHOP_CATALOGUE_PATH = os.getenv(
+    "LULU_SHOP_CATALOGUE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "shop_location.json")
+)
+
+# Shop columns per day type: Monday-Friday, Saturday, Sunday (blank means closed)
+HOURS_COLUMNS = [
+    ("BUSINESS HOURS - Weekdays", "Business Hours"),
+    ("BUSINESS HOURS - Saturdays",),
+    ("BUSINESS HOURS - Sundays & Public Holidays",),
+]
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+_TIME = r"(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm)?"
+# A time in a question: '9am' / '10.30 pm', or a clock time '18:30' / 'at 9.15';
+# never a bare number ('at 2 shops') or a dotted decimal without 'at' (a coordinate)
+_MERIDIEM_TIME = re.compile(r"\b(\d{1,2})(?:[:.]([0-5]\d))?\s*(am|pm)\b")
+_CLOCK_TIME = re.compile(r"\b(at\s+)?(\d{1,2})([:.])([0-5]\d)\b")
+_NOON = re.compile(r"\b(noon|midday)\b")
+
+# ---------------- Hours Parsing ------------------
+def _minutes(hour, minute, meridiem):
+    hour = int(hour)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    return hour * 60 + int(minute or 0)
+
+def parse_hours(text):
+    """'8:00am - 6:00 pm' (also '8.30am', '9:00 am') as (open, close) minutes after midnight, or None."""
+    match = re.search(f"{_TIME}\\s*-\\s*{_TIME}", (text or "").lower())
+    if not match:
+        return None
+    opens, closes = _minutes(*match.groups()[:3]), _minutes(*match.groups()[3:])
+    # A mistyped 'pm' on the opening time ('11.00pm - 6:00 pm') means the morning
+    if opens >= closes and opens >= 12 * 60:
+        opens -= 12 * 60
+    return (opens, closes) if opens < closes else None
+
+def shop_hours(data):
+    """[(open, close)] minutes per day type in HOURS_COLUMNS order; (0, 0) when closed or unreadable."""
+    return [
+        next((parse_hours(data[c]) for c in columns if data.get(c)), None) or (0, 0)
+        for columns in HOURS_COLUMNS
+    ]
+
+def day_type(when):
+    """Index into HOURS_COLUMNS: 0 for Monday-Friday, 1 for Saturday, 2 for Sunday."""
+    return max(when.weekday() - 4, 0)
+
+def parse_when(text, now=None):
+    """
+    The moment a question like 'which shops are open on sunday at 9am' asks about.
+    The day: 'today', 'tomorrow' or a weekday name (this week or next). The time:
+    '9am', '10.30 pm', '18:30', 'noon', with or without 'at'. A day without a time
+    keeps the current time of day; with neither, returns `now` (default: the
+    current time).
+    """
+    now = now or datetime.now()
+    text = (text or "").lower()
+    when = now
+    if re.search(r"\btomorrow\b", text):
+        when += timedelta(days=1)
+    elif not re.search(r"\btoday\b", text):
+        day = next((i for i, name in enumerate(WEEKDAYS) if re.search(rf"\b{name}\b", text)), None)
+        if day is not None:
+            when += timedelta(days=(day - now.weekday()) % 7)
+
+    meridiem = _MERIDIEM_TIME.search(text)
+    clock = next((m for m in _CLOCK_TIME.finditer(text) if m.group(1) or m.group(3) == ":"), None)
+    if meridiem and 1 <= int(meridiem.group(1)) <= 12:
+        minutes = _minutes(*meridiem.groups())
+    elif clock:
+        minutes = _minutes(clock.group(2), clock.group(4), None)
+    elif _NOON.search(text):
+        minutes = 12 * 60
+    else:
+        return when
+    if minutes < 24 * 60:
+        when = when.replace(hour=minutes // 60, minute=minutes % 60, second=0, microsecond=0)
+    return when
+
+# ---------------- Validation ------------------
+def validate_shops(raw):
+    """
+    Checks the parsed JSON: a {shop name: {field: value}} object. Entries that are
+    not objects are dropped and reported. Returns (shops, problems); raises
+    ValueError when the top level is not an object at all.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError(f"shop catalogue must be a JSON object of shops, not {type(raw).__name__}")
+    shops, problems = {}, []
+    for name, data in raw.items():
+        if not isinstance(data, dict):
+            problems.append(f"{name!r}: expected an object, got {type(data).__name__}")
+            continue
+        shops[str(name).strip()] = data
+    return shops, problems
+
+# ---------------- Catalogue ------------------
+class ShopCatalogue:
+    """
+    One validated snapshot of the shop list, with every shop's opening hours
+    parsed once into (shops x day types) minute arrays, so "which shops are open
+    at T" is a single vectorised comparison. The search and geo indexes are
+    built from the snapshot on first use and live exactly as long as it does.
+    """
+
+    def __init__(self, shops, problems=(), path=None, mtime=None):
+        self.shops = shops
+        self.problems = list(problems)
+        self.path = path
+        self.mtime = mtime
+        self.names = np.array(list(shops), dtype=object)
+        hours = np.array([shop_hours(data) for data in shops.values()], dtype=np.int16).reshape(-1, len(HOURS_COLUMNS), 2)
+        self.opens, self.closes = hours[:, :, 0], hours[:, :, 1]
+
+    @classmethod
+    def load(cls, path=SHOP_CATALOGUE_PATH):
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, "r", encoding="utf-8") as f:
+            shops, problems = validate_shops(json.load(f))
+        return cls(shops, problems, path, mtime)
+
+    def __len__(self):
+        return len(self.names)
+
+    def open_mask(self, when=None):
+        """Boolean array over `names`: which shops are open at `when` (default: now)."""
+        when = when or datetime.now()
+        minute = when.hour * 60 + when.minute
+        day = day_type(when)
+        return (self.opens[:, day] <= minute) & (minute < self.closes[:, day])
+
+    def open_at(self, when=None):
+        """Names of the shops open at `when` (default: now), in catalogue order."""
+        return self.names[self.open_mask(when)].tolist()
+
+    @cached_property
+    def search_index(self):
+        from shop_search import ShopIndex
+        return ShopIndex(self.shops)
+
+    @cached_property
+    def geo_index(self):
+        from shop_geo import ShopGeoIndex
+        return ShopGeoIndex(self)
+
+class CatalogueLoader:
+    """
+    Hands out the current ShopCatalogue, reloading it when the file's mtime
+    changes. Checking costs one stat() per call. A reload that fails (say, a
+    half-written file) keeps serving the previous snapshot and records `error`.
+    """
+
+    def __init__(self, path=SHOP_CATALOGUE_PATH):
+        self.path = path
+        self.error = None
+        self._catalogue = ShopCatalogue({}, path=path)
+        self._seen_mtime = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            self.error = f"Shop catalogue not found at {self.path}: {e.strerror}"
+            return self._catalogue
+        if mtime != self._seen_mtime:
+            with self._lock:
+                if mtime != self._seen_mtime:  # another session may have reloaded meanwhile
+                    try:
+                        self._catalogue = ShopCatalogue.load(self.path)
+                        self.error = None
+                    except (OSError, ValueError) as e:  # json.JSONDecodeError is a ValueError
+                        self.error = f"Could not load the shop catalogue {self.path}: {e}"
+                    self._seen_mtime = mtime
+        return self._catalogue
+
+@st.cache_resource
+def get_catalogue_loader(path=SHOP_CATALOGUE_PATH):
+    return CatalogueLoader(path)
+
+def get_shop_catalogue():
+    """The process-wide shop catalogue, hot-reloaded when the JSON file changes."""
+    return get_catalogue_loader().current()
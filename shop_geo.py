@@ -0,0 +1,125 @@
+import re
+from functools import lru_cache
+import numpy as np
+from shop_catalogue import get_shop_catalogue
+
+try:
+    from sklearn.neighbors import BallTree
+except ImportError:  # scikit-learn is optional; brute force is fine for a few thousand shops
+    BallTree = None
+
+# ---------------- Configuration ------------------
+EARTH_RADIUS_KM = 6371.0088
+NEAREST_K = 3
+# Below this many shops a vectorised brute-force pass beats building and querying a tree
+BALLTREE_MIN_SHOPS = 256
+# Caps the (queries x shops) similarity block held in memory by the brute-force pass
+BRUTE_FORCE_BLOCK = 4_000_000
+
+_LAT_LON = re.compile(r"(-?\d{1,2}\.\d+)\s*,\s*(-?\d{1,3}\.\d+)")
+
+# ---------------- Parsing ------------------
+def parse_coordinate(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return np.nan
+    return number if np.isfinite(number) else np.nan
+
+def find_coordinates(text):
+    """The first '-1.2864, 36.8172' style pair in a message as (lat, lon), or None."""
+    match = _LAT_LON.search(text or "")
+    if not match:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
+
+def _unit_vectors(radians):
+    lat, lon = radians[:, 0], radians[:, 1]
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+# ---------------- Geo Index ------------------
+class ShopGeoIndex:
+    """
+    The coordinates of a catalogue's shops parsed once into radian arrays
+    (opening hours come from the catalogue), answering k-nearest queries by
+    great-circle distance for one location or a whole batch.
+
+    With scikit-learn installed and enough shops, queries go through a haversine
+    BallTree (one per distinct set of open shops, cached); otherwise through a
+    vectorised brute-force haversine pass over the same arrays.
+    """
+
+    def __init__(self, catalogue):
+        positions, coordinates = [], []
+        for position, data in enumerate(catalogue.shops.values()):
+            lat, lon = parse_coordinate(data.get("Latitude")), parse_coordinate(data.get("Longitude"))
+            if np.isnan(lat) or np.isnan(lon) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                continue  # 'Blank' or missing coordinates cannot be placed on the map
+            positions.append(position)
+            coordinates.append((lat, lon))
+        self.catalogue = catalogue
+        self.shops = catalogue.shops
+        self.catalogue_positions = np.array(positions, dtype=np.int64)
+        self.names = catalogue.names[self.catalogue_positions]
+        self.radians = np.radians(np.array(coordinates, dtype=np.float64).reshape(-1, 2))
+        self.unit_vectors = _unit_vectors(self.radians)
+        self._tree = lru_cache(maxsize=32)(self._build_tree)
+
+    def __len__(self):
+        return len(self.names)
+
+    def open_mask(self, when=None):
+        """Boolean array: which shops are open at `when` (default: now), from the catalogue's parsed hours."""
+        return self.catalogue.open_mask(when)[self.catalogue_positions]
+
+    def _build_tree(self, mask_bytes):
+        positions = np.flatnonzero(np.frombuffer(mask_bytes, dtype=bool))
+        return BallTree(self.radians[positions], metric="haversine"), positions
+
+    def _brute_force(self, points, positions, k):
+        """Exact k-nearest by dot products of unit vectors; the largest dot product is the shortest arc."""
+        candidates = self.unit_vectors[positions]
+        queries = _unit_vectors(points)
+        distances = np.empty((len(points), k))
+        indices = np.empty((len(points), k), dtype=np.int64)
+        step = max(1, BRUTE_FORCE_BLOCK // len(candidates))
+        for start in range(0, len(points), step):
+            dots = queries[start:start + step] @ candidates.T
+            nearest = np.argpartition(-dots, k - 1, axis=1)[:, :k] if k < dots.shape[1] else np.tile(np.arange(k), (len(dots), 1))
+            nearest_dots = np.take_along_axis(dots, nearest, axis=1)
+            order = np.argsort(-nearest_dots, axis=1)
+            chord = np.sqrt(np.clip(2 - 2 * np.take_along_axis(nearest_dots, order, axis=1), 0, 4))
+            distances[start:start + len(dots)] = 2 * np.arcsin(chord / 2)
+            indices[start:start + len(dots)] = np.take_along_axis(nearest, order, axis=1)
+        return distances, positions[indices]
+
+    def nearest_batch(self, latitudes, longitudes, k=NEAREST_K, open_at=None, open_only=True):
+        """
+        Vectorised k-nearest lookup for many locations at once. Returns
+        (distances_km, positions), both shaped (n, k'), where k' <= k is capped by
+        the number of eligible shops; positions index `names`.
+        """
+        points = np.radians(np.column_stack([np.asarray(latitudes, dtype=np.float64), np.asarray(longitudes, dtype=np.float64)]))
+        mask = self.open_mask(open_at) if open_only else np.ones(len(self), dtype=bool)
+        k = min(k, int(mask.sum()))
+        if k == 0:
+            return np.empty((len(points), 0)), np.empty((len(points), 0), dtype=np.int64)
+        if BallTree is not None and mask.sum() >= BALLTREE_MIN_SHOPS:
+            tree, positions = self._tree(mask.tobytes())
+            distances, indices = tree.query(points, k=k)
+            return distances * EARTH_RADIUS_KM, positions[indices]
+        distances, positions = self._brute_force(points, np.flatnonzero(mask), k)
+        return distances * EARTH_RADIUS_KM, positions
+
+    def nearest(self, latitude, longitude, k=NEAREST_K, open_at=None, open_only=True):
+        """The k nearest (open) shops to one location, as dicts with name, distance_km and shop data."""
+        distances, positions = self.nearest_batch([latitude], [longitude], k, open_at, open_only)
+        return [
+            {"name": self.names[p], "distance_km": round(float(d), 2), "shop": self.shops[self.names[p]]}
+            for d, p in zip(distances[0], positions[0])
+        ]
+
+def get_shop_geo_index():
+    """Geo index over the current shop catalogue; rebuilt when the catalogue file changes."""
+    return get_shop_catalogue().geo_index
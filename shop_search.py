@@ -0,0 +1,166 @@
+import re
+from collections import defaultdict
+from functools import lru_cache
+from shop_catalogue import get_shop_catalogue
+
+# ---------------- Configuration ------------------
+# Extra names agents use for a shop, keyed by its SHOP_LOCATIONS name
+SHOP_ALIASES = {
+    "THIKA ROAD MALL (TRM)": ["trm", "thika road mall"],
+    "SARIT CENTRE": ["sarit", "westlands"],
+    "THE HUB": ["hub karen", "karen"],
+    "Samburu - Maralal": ["maralal", "samburu"],
+    "HOMABAY": ["homa bay"],
+    "KIAMBU ROAD": ["thindigua"],
+    "MEGA KISUMU": ["mega mall kisumu"],
+    "GILFILLAN": ["kenyatta avenue nairobi"],
+    "RONGAI": ["ongata rongai"],
+}
+
+# Words that say nothing about which shop is meant; they may complete a match but never start one
+GENERIC_TOKENS = {
+    "a", "airtel", "along", "and", "at", "avenue", "besides", "blank", "building", "can", "center", "centre",
+    "find", "floor", "for", "ground", "highway", "i", "in", "inside", "is", "located", "location", "mall",
+    "me", "my", "near", "nearest", "next", "of", "opposite", "outlet", "plaza", "road", "shop", "shops",
+    "store", "street", "supermarket", "the", "to", "town", "what", "where", "which",
+    # Opening-hours questions ("which shops are open on saturday at 9am")
+    "am", "are", "closed", "hours", "now", "on", "open", "pm", "time", "today", "tomorrow",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+}
+
+NAME_WEIGHT = 1.0
+ALIAS_WEIGHT = 0.9
+LOCATION_WEIGHT = 0.4
+SPECIFICITY_BONUS = 0.05
+MIN_MATCH_SCORE = 0.4
+MIN_FUZZY_LENGTH = 4
+
+def normalise(text):
+    """Lower-cased word tokens with apostrophes dropped, so "Murang'a" and "muranga" agree."""
+    return re.findall(r"[a-z0-9]+", (text or "").lower().replace("'", "").replace("’", ""))
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 as soon as it is known to exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+# ---------------- Shop Index ------------------
+class ShopIndex:
+    """
+    Token index over shop names, aliases and physical locations, built once.
+
+    Every name/alias is a phrase and every distinctive location word a one-word
+    phrase; a posting list maps each token to the phrases containing it, so a
+    query is matched against all patterns at once in a single pass over its
+    tokens. Tokens with no exact posting fall back to a trigram index over the
+    vocabulary, verified by edit distance. A shop scores by how much of its best
+    phrase the query covers, weighted by where the phrase came from.
+    """
+
+    def __init__(self, shops, aliases=SHOP_ALIASES):
+        self.shops = list(shops.items())
+        self._phrases = []                      # (shop position, weight, token count)
+        self._postings = defaultdict(list)      # token -> [phrase id]
+        for position, (name, data) in enumerate(self.shops):
+            self._add_phrase(position, NAME_WEIGHT, normalise(name))
+            if data.get("SHOP NAME", name) != name:
+                self._add_phrase(position, NAME_WEIGHT, normalise(data["SHOP NAME"]))
+            for alias in aliases.get(name, []):
+                self._add_phrase(position, ALIAS_WEIGHT, normalise(alias))
+            location = f"{data.get('PHYSICAL LOCATION', '')} {data.get('Plus Code', '')}"
+            for token in set(normalise(location)):
+                if token not in GENERIC_TOKENS and not any(c.isdigit() for c in token):
+                    self._add_phrase(position, LOCATION_WEIGHT, [token])
+
+        self._vocabulary = list(self._postings)
+        self._term_trigrams = [trigrams(term) for term in self._vocabulary]
+        self._trigram_index = defaultdict(list)
+        for term_id, grams in enumerate(self._term_trigrams):
+            for gram in grams:
+                self._trigram_index[gram].append(term_id)
+        self._fuzzy = lru_cache(maxsize=4096)(self._fuzzy_terms)
+
+    def _add_phrase(self, position, weight, tokens):
+        tokens = list(dict.fromkeys(tokens))
+        if not tokens or all(t in GENERIC_TOKENS for t in tokens):
+            return
+        phrase_id = len(self._phrases)
+        self._phrases.append((position, weight, len(tokens)))
+        for token in tokens:
+            self._postings[token].append(phrase_id)
+
+    def __len__(self):
+        return len(self.shops)
+
+    def _fuzzy_terms(self, token):
+        """Vocabulary terms within a small edit distance of `token`, as (term, similarity)."""
+        limit = 1 if len(token) <= 5 else 2
+        # Each edit touches at most three of the token's trigrams, so any term within
+        # `limit` edits shares at least one of its 3 * limit + 1 rarest trigrams
+        grams = trigrams(token)
+        rarest = sorted(grams, key=lambda gram: len(self._trigram_index.get(gram, ())))[:3 * limit + 1]
+        candidates = set()
+        for gram in rarest:
+            candidates.update(self._trigram_index.get(gram, ()))
+        matches = []
+        for term_id in candidates:
+            if len(grams & self._term_trigrams[term_id]) < len(grams) - 3 * limit:
+                continue
+            term = self._vocabulary[term_id]
+            distance = edit_distance(token, term, limit)
+            if distance <= limit:
+                matches.append((term, 1 - distance / max(len(token), len(term))))
+        return tuple(matches)
+
+    def search(self, query, limit=5):
+        """Ranked candidate shops for a free-text query, as dicts with name, score and shop data."""
+        covered = defaultdict(float)            # phrase id -> summed token similarity
+        distinctive = set()                     # phrase ids hit by at least one non-generic token
+        for token in set(normalise(query)):
+            if token in self._postings:
+                hits = [(token, 1.0)]
+            elif len(token) >= MIN_FUZZY_LENGTH and token not in GENERIC_TOKENS:
+                hits = self._fuzzy(token)
+            else:
+                continue
+            for term, similarity in hits:
+                for phrase_id in self._postings[term]:
+                    covered[phrase_id] += similarity
+                    if term not in GENERIC_TOKENS:
+                        distinctive.add(phrase_id)
+
+        best = {}
+        for phrase_id in distinctive:
+            position, weight, length = self._phrases[phrase_id]
+            matched = covered[phrase_id]
+            score = weight * min(matched / length, 1.0) + SPECIFICITY_BONUS * matched
+            if score > best.get(position, 0.0):
+                best[position] = score
+
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [
+            {"name": self.shops[position][0], "score": round(score, 3), "shop": self.shops[position][1]}
+            for position, score in ranked
+        ]
+
+    def best_match(self, query, min_score=MIN_MATCH_SCORE):
+        """The top-ranked shop's data if it clears `min_score`, else None."""
+        candidates = self.search(query, limit=1)
+        return candidates[0]["shop"] if candidates and candidates[0]["score"] >= min_score else None
+
+def get_shop_index():
+    """Index over the current shop catalogue; rebuilt when the catalogue file changes."""
+    return get_shop_catalogue().search_index
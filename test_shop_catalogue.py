@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+
+from shop_catalogue import parse_when
+
+# A Wednesday afternoon
+NOW = datetime(2026, 10, 14, 15, 20, 45)
+
+@pytest.mark.parametrize("question, expected", [
+    ("is it open tomorrow at 9am", datetime(2026, 10, 15, 9, 0)),
+    ("open tomorrow 9:30 pm?", datetime(2026, 10, 15, 21, 30)),
+    ("which shops are open today at 18:30", datetime(2026, 10, 14, 18, 30)),
+    ("open saturday 10am", datetime(2026, 10, 17, 10, 0)),
+    ("open on sunday at 9.15", datetime(2026, 10, 18, 9, 15)),
+    ("is Westgate open on Monday at noon", datetime(2026, 10, 19, 12, 0)),
+    ("open at 12am", datetime(2026, 10, 14, 0, 0)),
+    ("open 7 PM", datetime(2026, 10, 14, 19, 0)),
+])
+def test_day_and_time(question, expected):
+    assert parse_when(question, NOW) == expected
+
+@pytest.mark.parametrize("question, expected", [
+    ("open tomorrow", datetime(2026, 10, 15, 15, 20, 45)),
+    ("is it open today", NOW),
+    ("open wednesday", NOW),
+    ("open friday", datetime(2026, 10, 16, 15, 20, 45)),
+])
+def test_day_without_time_keeps_time_of_day(question, expected):
+    assert parse_when(question, NOW) == expected
+
+@pytest.mark.parametrize("question", [
+    "which shops are open",
+    "are at 2 shops open near me",
+    "shops open near -1.29, 36.82",
+    "open at 25:00",
+    "open at 9:75",
+    "open 13pm",
+    "",
+    None,
+])
+def test_no_time(question):
+    assert parse_when(question, NOW) == NOW
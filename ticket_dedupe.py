@@ -0,0 +1,120 @@
+import re
+import zlib
+from datetime import datetime
+import numpy as np
+from tickets import TIMESTAMP_FORMAT, msisdn_variants, normalise_msisdn
+
+# ---------------- MinHash Configuration ------------------
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 4
+DUPLICATE_THRESHOLD = 0.5
+MERSENNE_PRIME = (1 << 31) - 1
+
+# Fixed seed: signatures are stored, so the permutations must never change between runs
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.int64)[:, None]
+_PERM_B = _rng.integers(0, MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.int64)[:, None]
+
+# ---------------- Signatures ------------------
+def shingles(text):
+    """Character 4-grams of the lower-cased, punctuation-free description."""
+    normalised = " ".join(re.findall(r"\w+", (text or "").lower()))
+    if len(normalised) <= SHINGLE_SIZE:
+        return {normalised} if normalised else set()
+    return {normalised[i:i + SHINGLE_SIZE] for i in range(len(normalised) - SHINGLE_SIZE + 1)}
+
+def minhash_signature(text):
+    """64 MinHash values (uint32) estimating the shingle-set Jaccard similarity of two descriptions."""
+    hashes = np.fromiter((zlib.crc32(s.encode()) & MERSENNE_PRIME for s in shingles(text)), dtype=np.int64)
+    if hashes.size == 0:
+        return np.full(NUM_PERMUTATIONS, MERSENNE_PRIME, dtype=np.uint32)
+    # a*h + b stays below 2**62, so int64 arithmetic is exact
+    return ((_PERM_A * hashes[None, :] + _PERM_B) % MERSENNE_PRIME).min(axis=1).astype(np.uint32)
+
+# ---------------- Index Maintenance ------------------
+def index_ticket(conn, ticket_id, agent_msisdn, issue_tag, issue_text):
+    """
+    Adds or refreshes a ticket's signature under the normalised agent MSISDN. Runs on
+    the caller's transaction; closing or deleting the ticket removes it again via the
+    triggers from migration 8.
+    """
+    agent_msisdn = normalise_msisdn(agent_msisdn) or agent_msisdn
+    conn.execute("""
+        INSERT INTO ticket_minhash (ticket_id, agent_msisdn, issue_tag, signature) VALUES (?, ?, ?, ?)
+        ON CONFLICT (ticket_id) DO UPDATE SET
+            agent_msisdn = excluded.agent_msisdn, issue_tag = excluded.issue_tag, signature = excluded.signature
+    """, (ticket_id, agent_msisdn, issue_tag, minhash_signature(issue_text).tobytes()))
+
+def backfill_index(conn):
+    """Signs every ticket that is not closed. Used when the index is first created."""
+    rows = conn.execute("""
+        SELECT ticket_id, agent_msisdn, issue_tag, issue_text FROM channel_partners_tickets
+        WHERE COALESCE(status, '') != 'Closed'
+    """).fetchall()
+    for row in rows:
+        index_ticket(conn, *row)
+
+# ---------------- Duplicate Lookup ------------------
+def find_duplicates(conn, agent_msisdn, issue_tag, issue_text, threshold=DUPLICATE_THRESHOLD, limit=5):
+    """
+    Returns up to `limit` open tickets for the same agent and tag whose description
+    is estimated to be at least `threshold` similar, most similar first, as dicts.
+    Candidates come from the (agent_msisdn, issue_tag) index, so the cost depends on
+    that agent's open tickets only. The number is matched in every stored form, as a
+    signature an agent or tag edit carried over may hold it unnormalised.
+    """
+    msisdn = normalise_msisdn(agent_msisdn)
+    variants = msisdn_variants(msisdn) if msisdn else [agent_msisdn]
+    candidates = conn.execute(f"""
+        SELECT m.ticket_id, m.signature, t.issue_text, t.status, t.level, t.created_at
+        FROM ticket_minhash m
+        JOIN channel_partners_tickets t ON t.ticket_id = m.ticket_id AND t.status != 'Closed'
+        WHERE m.agent_msisdn IN ({', '.join('?' * len(variants))}) AND m.issue_tag = ?
+    """, variants + [issue_tag]).fetchall()
+    if not candidates:
+        return []
+
+    signature = minhash_signature(issue_text)
+    stored = np.frombuffer(b"".join(row[1] for row in candidates), dtype=np.uint32).reshape(len(candidates), -1)
+    similarity = (stored == signature).mean(axis=1)
+
+    duplicates = [
+        {
+            "ticket_id": row[0], "similarity": round(float(score), 2), "issue_text": row[2],
+            "status": row[3], "level": row[4], "created_at": row[5],
+        }
+        for row, score in zip(candidates, similarity)
+        if score >= threshold
+    ]
+    return sorted(duplicates, key=lambda d: d["similarity"], reverse=True)[:limit]
+
+def merge_into_ticket(conn, ticket_id, issue_text, image_path=""):
+    """
+    Appends a repeated report to an existing ticket instead of opening a new one and
+    refreshes its signature, so later reports are compared against the merged text.
+    A ticket keeps one screenshot: if it already has one, the new screenshot is not
+    attached and the appended report says so. Returns whether `image_path` was attached.
+    Runs on the caller's transaction, so storing the screenshot and the merge commit together.
+    """
+    now = datetime.now().strftime(TIMESTAMP_FORMAT)
+    current = conn.execute(
+        "SELECT COALESCE(image_path, '') FROM channel_partners_tickets WHERE ticket_id = ?", (ticket_id,)
+    ).fetchone()
+    attached = bool(image_path) and current is not None and not current[0]
+    note = f"\n\n[Reported again {now}] {issue_text}"
+    if image_path and not attached:
+        note += " (a screenshot was sent with this report but not attached: the ticket already has one)"
+    conn.execute("""
+        UPDATE channel_partners_tickets
+        SET issue_text = COALESCE(issue_text, '') || ?,
+            image_path = CASE WHEN ? THEN ? ELSE image_path END,
+            last_updated = ?
+        WHERE ticket_id = ?
+    """, (note, attached, image_path, now, ticket_id))
+    ticket = conn.execute(
+        "SELECT agent_msisdn, issue_tag, issue_text, status FROM channel_partners_tickets WHERE ticket_id = ?",
+        (ticket_id,),
+    ).fetchone()
+    if ticket and ticket[3] != "Closed":
+        index_ticket(conn, ticket_id, *ticket[:3])
+    return attached
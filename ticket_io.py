@@ -0,0 +1,256 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+from tickets import (
+    TICKET_COLUMNS, TICKET_LEVELS, TICKET_STATUSES, TICKET_TAGS, TIMESTAMP_FORMAT,
+    build_ticket_filters, new_ticket_id, normalise_msisdn,
+)
+from ticket_dedupe import minhash_signature
+
+# ---------------- Configuration ------------------
+CHUNK_SIZE = 5000
+MAX_REPORTED_REJECTS = 100
+
+# ---------------- Validation ------------------
+def _choice(raw, field, allowed, default):
+    value = str(raw.get(field) or default).strip()
+    if value not in allowed:
+        raise ValueError(f"unknown {field} {value!r}")
+    return value
+
+def _timestamp(raw, field, default):
+    value = raw.get(field) or default
+    try:
+        datetime.strptime(value, TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} {value!r} is not in {TIMESTAMP_FORMAT} format") from None
+    return value
+
+def prepare_ticket_row(raw, now):
+    """
+    Validates one imported record and fills in the defaults the ticket form uses.
+    Returns a tuple in TICKET_COLUMNS order; raises ValueError for bad records.
+    """
+    msisdn = normalise_msisdn(raw.get("agent_msisdn") or raw.get("msisdn"))
+    if not msisdn:
+        raise ValueError(f"invalid MSISDN {raw.get('agent_msisdn') or raw.get('msisdn')!r}")
+    issue_text = (raw.get("issue_text") or "").strip()
+    if not issue_text:
+        raise ValueError("missing issue_text")
+    issue_tag = _choice(raw, "issue_tag", TICKET_TAGS, "Other")
+
+    created_at = _timestamp(raw, "created_at", now)
+    row = {
+        "ticket_id": raw.get("ticket_id") or new_ticket_id(),
+        "agent_msisdn": msisdn,
+        "issue_text": issue_text,
+        "issue_tag": issue_tag,
+        "status": _choice(raw, "status", TICKET_STATUSES, "Open"),
+        "level": _choice(raw, "level", TICKET_LEVELS, "L0"),
+        "assigned_to": raw.get("assigned_to") or "Intern",
+        "image_path": raw.get("image_path") or "",
+        "created_at": created_at,
+        "last_updated": _timestamp(raw, "last_updated", created_at),
+    }
+    return tuple(row[column] for column in TICKET_COLUMNS)
+
+# ---------------- Streaming Readers ------------------
+def iter_ticket_records(stream, fmt):
+    """
+    Yields (line_number, dict) pairs from a text stream of CSV or JSONL without
+    reading it whole. A JSONL line that is not a JSON object is yielded as
+    (line_number, ValueError) so the import rejects it like any other bad record.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    record = ValueError(f"malformed JSON: {e}")
+                if not isinstance(record, (dict, ValueError)):
+                    record = ValueError(f"expected a JSON object, got {type(record).__name__}")
+                yield line_number, record
+    else:
+        raise ValueError(f"Unsupported format {fmt!r}")
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# ---------------- Bulk Import ------------------
+def _reissue_colliding_ids(conn, rows, generated):
+    """
+    Generated 8-hex ids can collide in a large batch; gives each generated id that
+    clashes with a stored ticket or another id in the batch a fresh one, so only
+    supplied ids are ever skipped as duplicates.
+    """
+    taken = {row[0] for i, row in enumerate(rows) if i not in generated}
+    for i in sorted(generated):
+        ticket_id = rows[i][0]
+        while ticket_id in taken or conn.execute(
+            "SELECT 1 FROM channel_partners_tickets WHERE ticket_id = ?", (ticket_id,)
+        ).fetchone():
+            ticket_id = new_ticket_id()
+        taken.add(ticket_id)
+        rows[i] = (ticket_id, *rows[i][1:])
+
+def _rows_to_insert(conn, rows):
+    """The rows INSERT OR IGNORE will actually insert: the first of each id not already stored."""
+    ids = list({row[0] for row in rows})
+    seen = set()
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        seen.update(r[0] for r in conn.execute(
+            f"SELECT ticket_id FROM channel_partners_tickets WHERE ticket_id IN ({', '.join('?' * len(chunk))})", chunk
+        ))
+    new_rows = []
+    for row in rows:
+        if row[0] not in seen:
+            seen.add(row[0])
+            new_rows.append(row)
+    return new_rows
+
+def import_tickets(conn, records, chunk_size=CHUNK_SIZE, on_progress=None):
+    """
+    Inserts (line_number, dict) records in batches of `chunk_size`, one transaction
+    per batch. Invalid records are rejected with a reason, duplicate ticket ids are
+    skipped. Returns a summary dict with inserted / skipped / rejected counts.
+    """
+    now = datetime.now().strftime(TIMESTAMP_FORMAT)
+    insert = f"""
+        INSERT OR IGNORE INTO channel_partners_tickets ({', '.join(TICKET_COLUMNS)})
+        VALUES ({', '.join('?' * len(TICKET_COLUMNS))})
+    """
+    summary = {"inserted": 0, "skipped": 0, "rejected": 0, "rejects": []}
+    started = time.perf_counter()
+
+    for chunk in _chunks(records, chunk_size):
+        rows, generated = [], set()
+        for line_number, record in chunk:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                rows.append(prepare_ticket_row(record, now))
+                if not record.get("ticket_id"):
+                    generated.add(len(rows) - 1)
+            except (ValueError, AttributeError) as e:
+                summary["rejected"] += 1
+                if len(summary["rejects"]) < MAX_REPORTED_REJECTS:
+                    summary["rejects"].append((line_number, str(e)))
+
+        with conn:
+            _reissue_colliding_ids(conn, rows, generated)
+            new_rows = _rows_to_insert(conn, rows)
+            # rowcount counts the ticket rows only, not the summary-table trigger writes
+            inserted = conn.executemany(insert, rows).rowcount
+            # Sign the open tickets this batch inserted for duplicate detection; rows skipped
+            # as duplicates belong to stored tickets, whose signature (or lack of one) stands
+            conn.executemany(
+                "INSERT OR IGNORE INTO ticket_minhash (ticket_id, agent_msisdn, issue_tag, signature) VALUES (?, ?, ?, ?)",
+                [
+                    (row[0], row[1], row[3], minhash_signature(row[2]).tobytes())
+                    for row in new_rows if row[4] != "Closed"
+                ],
+            )
+        summary["inserted"] += inserted
+        summary["skipped"] += len(rows) - inserted
+        if on_progress:
+            on_progress(summary)
+
+    summary["seconds"] = time.perf_counter() - started
+    return summary
+
+# ---------------- Chunked Export ------------------
+def export_tickets(conn, stream, fmt="csv", filters=None, chunk_size=CHUNK_SIZE):
+    """
+    Writes the tickets matching `filters` to a text stream as CSV or JSONL,
+    fetching `chunk_size` rows at a time. Returns the number of rows written.
+    """
+    where, params = build_ticket_filters(**(filters or {}))
+    cursor = conn.execute(f"""
+        SELECT {', '.join(TICKET_COLUMNS)} FROM channel_partners_tickets
+        {where}
+        ORDER BY last_updated DESC, ticket_id DESC
+    """, params)
+
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(TICKET_COLUMNS)
+    elif fmt != "jsonl":
+        raise ValueError(f"Unsupported format {fmt!r}")
+
+    written = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        if writer:
+            writer.writerows(rows)
+        else:
+            stream.writelines(json.dumps(dict(zip(TICKET_COLUMNS, row))) + "\n" for row in rows)
+        written += len(rows)
+    return written
+
+# ---------------- CLI ------------------
+def _format_for(path, fmt):
+    return fmt or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+
+def main(argv=None):
+    from db import DB_PATH, Database
+
+    parser = argparse.ArgumentParser(description="Bulk import / export of channel partner tickets.")
+    parser.add_argument("--db", default=DB_PATH, help="Path to the SQLite database")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subcommands.add_parser("import", help="Import tickets from a CSV or JSONL file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "jsonl"])
+    import_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    export_parser = subcommands.add_parser("export", help="Export tickets to a CSV or JSONL file ('-' for stdout)")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=["csv", "jsonl"])
+    export_parser.add_argument("--status", action="append")
+    export_parser.add_argument("--level", action="append")
+    export_parser.add_argument("--tag", action="append")
+    export_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    args = parser.parse_args(argv)
+    conn = Database(args.db).connection()
+
+    if args.command == "import":
+        with open(args.path, newline="", encoding="utf-8-sig") as f:
+            records = iter_ticket_records(f, _format_for(args.path, args.format))
+            summary = import_tickets(conn, records, chunk_size=args.chunk_size)
+        rate = summary["inserted"] / summary["seconds"] if summary["seconds"] else 0
+        print(f"Inserted {summary['inserted']}, skipped {summary['skipped']} duplicates, "
+              f"rejected {summary['rejected']} in {summary['seconds']:.2f}s ({rate:,.0f} rows/s)")
+        for line_number, reason in summary["rejects"]:
+            print(f"  line {line_number}: {reason}", file=sys.stderr)
+    else:
+        filters = {"statuses": args.status, "levels": args.level, "tags": args.tag}
+        fmt = _format_for(args.path, args.format)
+        if args.path == "-":
+            written = export_tickets(conn, sys.stdout, fmt, filters, args.chunk_size)
+        else:
+            with open(args.path, "w", newline="", encoding="utf-8") as f:
+                written = export_tickets(conn, f, fmt, filters, args.chunk_size)
+        print(f"Exported {written} tickets.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import re
+from datetime import datetime
+from tickets import TIMESTAMP_FORMAT, msisdn_variants, normalise_msisdn
+
+# ---------------- Configuration ------------------
+LOOKUP_COLUMNS = ["ticket_id", "agent_msisdn", "issue_tag", "status", "level", "assigned_to", "created_at", "last_updated"]
+OPEN_STATUSES = ["Open", "Escalated"]
+AGENT_PAGE_SIZE = 5
+MAX_TICKET_IDS = 10
+
+# Ticket ids come in three shapes: 8 hex digits from the form, 12 hex digits from
+# early bulk imports and plain integers from the legacy `tid` column. Anything after
+# '#' or "ticket" (with at least one digit) is taken as an id; a bare token only counts
+# when it is 8 or 12 hex digits with a letter (so dates and amounts are not read as
+# ids) and a ticket with that id exists.
+MARKED_TICKET_ID_PATTERN = re.compile(r"#([0-9a-z][0-9a-z\-]*)\b", re.IGNORECASE)
+KEYWORD_TICKET_ID_PATTERN = re.compile(
+    r"\btickets?\s*(?:id|no\.?|number)?\s*[:#]?\s*((?=[0-9a-z\-]*\d)[0-9a-z][0-9a-z\-]*)\b", re.IGNORECASE
+)
+BARE_TICKET_ID_PATTERN = re.compile(r"\b(?=\d*[a-f])([0-9a-f]{12}|[0-9a-f]{8})\b", re.IGNORECASE)
+MSISDN_CANDIDATE_PATTERN = re.compile(r"\+?\d[\d \-]{7,14}\d")
+
+# ---------------- Parsing ------------------
+def _canonical_id(token):
+    # Issued hex ids are stored in lower case; legacy ids are kept as written
+    return token.lower() if re.fullmatch(r"[0-9a-f]+", token, re.IGNORECASE) else token
+
+def find_ticket_references(conn, text):
+    """
+    (ticket_ids, msisdns) mentioned in a chat message, in order and without repeats.
+    Ids marked with '#' or "ticket" are returned as written (so a wrong one gets a
+    "no ticket" reply); bare hex tokens are kept only if they match a stored ticket.
+    """
+    ticket_ids = [_canonical_id(t) for t in MARKED_TICKET_ID_PATTERN.findall(text)]
+    text = MARKED_TICKET_ID_PATTERN.sub(" ", text)
+    msisdns = []
+    for match in MSISDN_CANDIDATE_PATTERN.finditer(text):
+        msisdn = normalise_msisdn(match.group())
+        if msisdn and msisdn not in msisdns:
+            msisdns.append(msisdn)
+            text = text.replace(match.group(), " ")
+    ticket_ids += [_canonical_id(t) for t in KEYWORD_TICKET_ID_PATTERN.findall(text)]
+    text = KEYWORD_TICKET_ID_PATTERN.sub(" ", text)
+    candidates = list(dict.fromkeys(t.lower() for t in BARE_TICKET_ID_PATTERN.findall(text)))[:MAX_TICKET_IDS]
+    stored = fetch_tickets(conn, candidates)
+    ticket_ids += [t for t in candidates if t in stored]
+    return list(dict.fromkeys(ticket_ids))[:MAX_TICKET_IDS], msisdns
+
+def ticket_age(created_at, now=None):
+    try:
+        seconds = ((now or datetime.now()) - datetime.strptime(created_at, TIMESTAMP_FORMAT)).total_seconds()
+    except (TypeError, ValueError):
+        return "unknown age"
+    days, hours = divmod(int(max(seconds, 0)) // 3600, 24)
+    return f"{days}d {hours}h" if days else f"{hours}h"
+
+# ---------------- Indexed Reads ------------------
+def fetch_tickets(conn, ticket_ids):
+    """Tickets by id (primary key lookups), as dicts keyed by ticket_id."""
+    if not ticket_ids:
+        return {}
+    rows = conn.execute(f"""
+        SELECT {', '.join(LOOKUP_COLUMNS)} FROM channel_partners_tickets
+        WHERE ticket_id IN ({', '.join('?' * len(ticket_ids))})
+    """, list(ticket_ids)).fetchall()
+    return {row[0]: dict(zip(LOOKUP_COLUMNS, row)) for row in rows}
+
+def fetch_agent_open_tickets(conn, msisdn, page_size=AGENT_PAGE_SIZE, after=None):
+    """
+    One page of an agent's open or escalated tickets, most recently updated first,
+    read through idx_tickets_agent_recent (the unary + keeps SQLite from picking
+    the far less selective status index instead). Returns (tickets, next_cursor) like
+    tickets.fetch_ticket_page; the cursor is None on the last page.
+    """
+    variants = msisdn_variants(msisdn)
+    where = f"""
+        WHERE agent_msisdn IN ({', '.join('?' * len(variants))})
+          AND +status IN ({', '.join('?' * len(OPEN_STATUSES))})
+    """
+    params = variants + OPEN_STATUSES
+    if after is not None:
+        where += " AND (last_updated, ticket_id) < (?, ?)"
+        params += list(after)
+    rows = conn.execute(f"""
+        SELECT {', '.join(LOOKUP_COLUMNS)} FROM channel_partners_tickets
+        {where}
+        ORDER BY last_updated DESC, ticket_id DESC
+        LIMIT ?
+    """, params + [page_size + 1]).fetchall()
+    tickets = [dict(zip(LOOKUP_COLUMNS, row)) for row in rows[:page_size]]
+    next_cursor = (tickets[-1]["last_updated"], tickets[-1]["ticket_id"]) if len(rows) > page_size else None
+    return tickets, next_cursor
+
+# ---------------- Chat Replies ------------------
+def format_ticket(ticket, now=None):
+    return (f"**#{ticket['ticket_id']}** · {ticket['issue_tag'] or 'Other'} · {ticket['status']} · {ticket['level']} · "
+            f"assigned to {ticket['assigned_to'] or 'nobody yet'} · {ticket_age(ticket['created_at'], now)} old")
+
+def ticket_status_reply(conn, ticket_ids, now=None):
+    found = fetch_tickets(conn, ticket_ids)
+    return "\n\n".join(
+        format_ticket(found[t], now) if t in found else f"**#{t}** · no ticket with this ID"
+        for t in ticket_ids
+    )
+
+def agent_tickets_reply(conn, msisdn, after=None, now=None):
+    """(reply, next_cursor) for one page of an agent's open tickets."""
+    tickets, next_cursor = fetch_agent_open_tickets(conn, msisdn, after=after)
+    if not tickets:
+        return (f"No {'more ' if after else ''}open tickets for agent {msisdn}.", None)
+    heading = f"Open tickets for agent {msisdn}{' (continued)' if after else ''}:"
+    return "\n\n".join([heading] + [format_ticket(t, now) for t in tickets]), next_cursor
@@ -0,0 +1,149 @@
+from datetime import datetime
+from tickets import TIMESTAMP_FORMAT
+
+# ---------------- Routing Configuration ------------------
+# Default assignee pool per escalation level; the least-loaded member is picked.
+ESCALATION_ASSIGNEES = {
+    "L1": ["Shelia"],
+    "L2": ["Caroline"],
+}
+
+# Evaluated top to bottom, first match wins. Every key under "match" is optional:
+#   issue_tag / level / status / region: allowed values
+#   min_age_hours: ticket must be at least this old (from created_at)
+#   max_assignee_load: only fires while the current assignee has fewer pending tickets
+# "level" is the level to move to; "assignees" defaults to ESCALATION_ASSIGNEES[level].
+ROUTING_RULES = [
+    {
+        "name": "Stale L1 tickets go to L2",
+        "match": {"level": ["L1"], "status": ["Open", "Escalated"], "min_age_hours": 48},
+        "level": "L2",
+    },
+    {
+        "name": "Float and KYC go straight to L1",
+        "match": {"issue_tag": ["Float", "KYC"], "level": ["L0"], "status": ["Open"]},
+        "level": "L1",
+    },
+    {
+        "name": "SIM Swap is always L2",
+        "match": {"issue_tag": ["SIM Swap"], "level": ["L0", "L1"], "status": ["Open", "Escalated"]},
+        "level": "L2",
+    },
+    {
+        "name": "Ageing L0 tickets go to L1",
+        "match": {"level": ["L0"], "status": ["Open"], "min_age_hours": 24},
+        "level": "L1",
+    },
+]
+
+# ---------------- Rule Evaluation ------------------
+def _age_hours(ticket, now):
+    try:
+        created = datetime.strptime(ticket["created_at"], TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        return 0
+    return (now - created).total_seconds() / 3600
+
+def rule_matches(rule, ticket, now, loads):
+    match = rule.get("match", {})
+    for field in ("issue_tag", "level", "status", "region"):
+        if field in match and ticket.get(field) not in match[field]:
+            return False
+    if "min_age_hours" in match and _age_hours(ticket, now) < match["min_age_hours"]:
+        return False
+    if "max_assignee_load" in match and loads.get(ticket.get("assigned_to"), 0) >= match["max_assignee_load"]:
+        return False
+    return True
+
+def assignee_loads(conn):
+    """Pending tickets per assignee, read from the maintained summary table."""
+    return dict(conn.execute("""
+        SELECT assigned_to, SUM(ticket_count) FROM channel_partners_ticket_stats
+        WHERE status != 'Closed'
+        GROUP BY assigned_to
+    """).fetchall())
+
+def _pick_assignee(candidates, loads, previous=None):
+    """Least-loaded candidate; the ticket's load moves from its previous assignee to the new one."""
+    assignee = min(candidates, key=lambda name: (loads.get(name, 0), name))
+    if assignee != previous:
+        loads[assignee] = loads.get(assignee, 0) + 1
+        if previous in loads:
+            loads[previous] -= 1
+    return assignee
+
+def _fetch_tickets(conn, ticket_ids):
+    tickets = []
+    ids = list(ticket_ids)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        cursor = conn.execute(f"""
+            SELECT t.ticket_id, t.agent_msisdn, t.issue_tag, t.status, t.level, t.assigned_to, t.created_at, r.region
+            FROM channel_partners_tickets t
+            LEFT JOIN agent_regions r ON r.agent_msisdn = t.agent_msisdn
+            WHERE t.ticket_id IN ({', '.join('?' * len(chunk))})
+        """, chunk)
+        columns = [d[0] for d in cursor.description]
+        tickets.extend(dict(zip(columns, row)) for row in cursor)
+    return tickets
+
+def _apply(conn, decisions, now):
+    timestamp = now.strftime(TIMESTAMP_FORMAT)
+    with conn:
+        # Closed tickets are never reopened, even if one was closed since it was read
+        conn.executemany("""
+            UPDATE channel_partners_tickets
+            SET level = ?, assigned_to = ?, status = ?, last_updated = ?
+            WHERE ticket_id = ? AND status != 'Closed'
+        """, [(d["level"], d["assigned_to"], d["status"], timestamp, d["ticket_id"]) for d in decisions])
+
+# ---------------- Bulk Actions ------------------
+def route_tickets(conn, ticket_ids, rules=ROUTING_RULES, now=None, dry_run=False):
+    """
+    Runs the routing rules over the selected tickets and applies every decision in
+    a single transaction. Closed tickets and tickets no rule matches are left alone.
+    Returns the list of decisions (ticket_id, rule, level, assigned_to, status).
+    """
+    now = now or datetime.now()
+    loads = assignee_loads(conn)
+    decisions = []
+    for ticket in _fetch_tickets(conn, ticket_ids):
+        if ticket["status"] == "Closed":
+            continue
+        for rule in rules:
+            if rule_matches(rule, ticket, now, loads):
+                level = rule["level"]
+                candidates = rule.get("assignees") or ESCALATION_ASSIGNEES[level]
+                decisions.append({
+                    "ticket_id": ticket["ticket_id"],
+                    "rule": rule["name"],
+                    "level": level,
+                    "assigned_to": _pick_assignee(candidates, loads, ticket["assigned_to"]),
+                    "status": "Escalated" if level != ticket["level"] else ticket["status"],
+                })
+                break
+    if decisions and not dry_run:
+        _apply(conn, decisions, now)
+    return decisions
+
+def escalate_tickets(conn, ticket_ids, level, now=None):
+    """
+    Escalates the selected tickets to `level` in one transaction, spreading them over
+    that level's assignees. Closed tickets are skipped.
+    """
+    now = now or datetime.now()
+    loads = assignee_loads(conn)
+    decisions = [
+        {
+            "ticket_id": ticket["ticket_id"],
+            "rule": "Manual escalation",
+            "level": level,
+            "assigned_to": _pick_assignee(ESCALATION_ASSIGNEES[level], loads, ticket["assigned_to"]),
+            "status": "Escalated",
+        }
+        for ticket in _fetch_tickets(conn, ticket_ids)
+        if ticket["status"] != "Closed"
+    ]
+    if decisions:
+        _apply(conn, decisions, now)
+    return decisions
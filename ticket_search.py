@@ -0,0 +1,47 @@
+import re
+import pandas as pd
+
+# ---------------- Full-Text Search ------------------
+SEARCH_COLUMNS = ["ticket_id", "agent_msisdn", "issue_tag", "status", "level", "assigned_to", "last_updated"]
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def fts_query(text):
+    """
+    Turns free text typed by an agent into a safe FTS5 query: every word is
+    quoted (so operators and punctuation can't break the syntax) and the last
+    word is matched as a prefix to support search-as-you-type.
+    """
+    tokens = TOKEN_PATTERN.findall(text)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+def search_tickets(conn, text, page_size=20, page=0):
+    """
+    Returns one page of tickets whose description matches `text`, best match first
+    (BM25), with the matching words wrapped in ** for markdown, plus a flag telling
+    whether more results follow.
+    """
+    query = fts_query(text)
+    if query is None:
+        return pd.DataFrame(columns=SEARCH_COLUMNS + ["snippet"]), False
+
+    df = pd.read_sql_query(f"""
+        SELECT {', '.join(f't.{column}' for column in SEARCH_COLUMNS)},
+               snippet(channel_partners_tickets_fts, 0, '**', '**', '…', 24) AS snippet
+        FROM channel_partners_tickets_fts
+        JOIN channel_partners_tickets t ON t.rowid = channel_partners_tickets_fts.rowid
+        WHERE channel_partners_tickets_fts MATCH ?
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    """, conn, params=(query, page_size + 1, page * page_size))
+
+    has_more = len(df) > page_size
+    return df.iloc[:page_size], has_more
+
+def rebuild_search_index(conn):
+    """Re-indexes every ticket; needed after VACUUM, which may renumber the rowids the index points at."""
+    with conn:
+        conn.execute("INSERT INTO channel_partners_tickets_fts (channel_partners_tickets_fts) VALUES ('rebuild')")
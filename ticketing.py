@@ -1,55 +1,70 @@
+import io
 import json
-import os
-import uuid
-import sqlite3
+import tempfile
 from datetime import datetime
 import streamlit as st
 import pandas as pd
+from tickets import (
+    TICKET_TAGS, TICKET_STATUSES, TICKET_LEVELS, new_ticket_id,
+    fetch_ticket_page, ticket_counts, ticket_breakdown,
+)
+from db import get_connection
+from ticket_io import iter_ticket_records, import_tickets, export_tickets, normalise_msisdn
+from ticket_dedupe import find_duplicates, index_ticket, merge_into_ticket
+from ocr_queue import enqueue_ocr_job, get_ocr_workers
+from ticket_search import search_tickets
+from ticket_routing import escalate_tickets, route_tickets
+from blob_store import BlobStore, store_ticket_image, thumbnail_data_uri
 
-# -------------- Simulated OCR & MiniCPM-V Reasoning ------------------
-def minicipm_ocr_pipeline(image_bytes):
-    # Simulate OCR output from image
-    extracted_text = "Transaction failed due to insufficient float."
-    # Simulate reasoning/tagging by MiniCPM-V
-    description = extracted_text
-    tag = "Float"
-    return description, tag
+# Thumbnails are content-addressed, so a path always maps to the same image
+@st.cache_data(max_entries=1000)
+def cached_thumbnail(path):
+    return thumbnail_data_uri(path)
+
+def save_ticket(conn, blob_store, ocr_workers, pending):
+    ticket_id = new_ticket_id()
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    image_path = ""
+
+    # The ticket, its image reference, OCR job and duplicate signature commit together;
+    # the tag stays provisional until OCR finishes
+    with conn:
+        if pending["image_bytes"]:
+            image_path = store_ticket_image(conn, blob_store, io.BytesIO(pending["image_bytes"]), pending["image_name"])
+        conn.execute("""
+            INSERT INTO channel_partners_tickets (ticket_id, agent_msisdn, issue_text, issue_tag, status, level, assigned_to, image_path, created_at, last_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (ticket_id, pending["agent_msisdn"], pending["issue_text"], pending["issue_tag"], "Open", "L0", "Intern", image_path, timestamp, timestamp))
+        index_ticket(conn, ticket_id, pending["agent_msisdn"], pending["issue_tag"], pending["issue_text"])
+        if image_path:
+            enqueue_ocr_job(conn, ticket_id, image_path)
+    if image_path:
+        ocr_workers.notify()
+        st.info("🔍 Screenshot queued for analysis; the description and tag will update shortly.")
+    st.success(f"✅ Ticket #{ticket_id} submitted!")
 
 # ---------------- Ticketing System ------------------
 def ticket_view():
     st.header("🎫 Partner Ticket Dashboard")
     st.divider()
 
-    # Database connection
-    conn = sqlite3.connect("channel_partners_agents.db", check_same_thread=False)
-    cursor = conn.cursor()
-
-    # Create table if not exists
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS channel_partners_tickets (
-            ticket_id TEXT PRIMARY KEY,
-            agent_msisdn TEXT,
-            issue_text TEXT,
-            issue_tag TEXT,
-            status TEXT,
-            level TEXT,
-            assigned_to TEXT,
-            image_path TEXT,
-            created_at TEXT,
-            last_updated TEXT
-        )
-    """)
-
-    # Stats
-    df_all = pd.read_sql_query("SELECT * FROM channel_partners_tickets", conn)
-    total = len(df_all)
-    resolved = df_all[df_all["status"] == "Closed"].shape[0]
-    pending = total - resolved
+    # Shared database connection (schema is set up once per process)
+    conn = get_connection()
+    ocr_workers = get_ocr_workers()
+    blob_store = BlobStore()
+
+    # Stats (served from the maintained summary table)
+    counts = ticket_counts(conn)
 
     col1, col2, col3 = st.columns(3,vertical_alignment='bottom')
-    col1.metric("Created Tickets", total)
-    col2.metric("Resolved", resolved)
-    col3.metric("Pending", pending)
+    col1.metric("Created Tickets", counts["total"])
+    col2.metric("Resolved", counts["resolved"])
+    col3.metric("Pending", counts["pending"])
+
+    with st.expander("📊 Ticket Breakdown"):
+        col1, col2 = st.columns(2)
+        col1.dataframe(ticket_breakdown(conn, "issue_tag"), hide_index=True)
+        col2.dataframe(ticket_breakdown(conn, "assigned_to"), hide_index=True)
 
     # ---------------- Ticket Creation Form ------------------
     st.divider()
@@ -57,63 +72,185 @@ def ticket_view():
     with st.form("ticket_form", clear_on_submit=True):
         msisdn = st.text_input("📱 Agent MSISDN")
         uploaded_image = st.file_uploader("📎 Upload Screenshot (Optional)", type=["png", "jpg", "jpeg"])
-
-        auto_description, auto_tag = "", ""
-        if uploaded_image:
-            auto_description, auto_tag = minicipm_ocr_pipeline(uploaded_image.read())
-
-        issue_text = st.text_area("📝 Issue Description", value=auto_description)
-        issue_tag = st.selectbox("🏷️ Tag", ["Float", "SIM Swap", "KYC", "Commission", "Network", "Training", "Other"], index=0 if not auto_tag else ["Float", "SIM Swap", "KYC", "Commission", "Network", "Training", "Other"].index(auto_tag))
+        issue_text = st.text_area("📝 Issue Description", help="Leave blank to fill it in from the screenshot.")
+        issue_tag = st.selectbox("🏷️ Tag", TICKET_TAGS)
         submit = st.form_submit_button("✅ Submit Ticket")
 
         if submit:
-            if msisdn and issue_text:
-                ticket_id = str(uuid.uuid4())[:8]
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                image_path = ""
-
-                if uploaded_image:
-                    os.makedirs("uploads", exist_ok=True)
-                    image_path = f"uploads/{ticket_id}_{uploaded_image.name}"
-                    with open(image_path, "wb") as f:
-                        f.write(uploaded_image.read())
-
-                conn.execute("""
-                    INSERT INTO channel_partners_tickets (ticket_id, agent_msisdn, issue_text, issue_tag, status, level, assigned_to, image_path, created_at, last_updated)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (ticket_id, msisdn, issue_text, issue_tag, "Open", "L0", "Intern", image_path, timestamp, timestamp))
-                conn.commit()
-                st.success(f"✅ Ticket #{ticket_id} submitted!")
+            agent_msisdn = normalise_msisdn(msisdn)
+            if agent_msisdn and (issue_text or uploaded_image):
+                pending = {
+                    "agent_msisdn": agent_msisdn,
+                    "issue_text": issue_text,
+                    "issue_tag": issue_tag,
+                    "image_name": uploaded_image.name if uploaded_image else "",
+                    "image_bytes": uploaded_image.getvalue() if uploaded_image else None,
+                }
+                duplicates = find_duplicates(conn, agent_msisdn, issue_tag, issue_text) if issue_text else []
+                if duplicates:
+                    # Hold the ticket until the agent decides whether to merge it
+                    st.session_state.pending_ticket = pending
+                    st.session_state.pending_duplicates = duplicates
+                else:
+                    save_ticket(conn, blob_store, ocr_workers, pending)
+            elif msisdn and not agent_msisdn:
+                st.warning("⚠️ Please enter a valid Kenyan MSISDN, e.g. 0712345678.")
             else:
-                st.warning("⚠️ Please provide Agent MSISDN and Issue description.")
+                st.warning("⚠️ Please provide Agent MSISDN and an Issue description or screenshot.")
+
+    # ---------------- Possible Duplicates ------------------
+    if st.session_state.get("pending_ticket"):
+        pending = st.session_state.pending_ticket
+        st.warning("⚠️ This looks like an issue that is already open for this agent.")
+        for duplicate in st.session_state.pending_duplicates:
+            col1, col2 = st.columns([4, 1], vertical_alignment='center')
+            col1.markdown(
+                f"**#{duplicate['ticket_id']}** ({duplicate['similarity']:.0%} similar) · "
+                f"{duplicate['status']} · {duplicate['level']} · {duplicate['created_at']}  \n{duplicate['issue_text']}"
+            )
+            if col2.button("🔗 Merge", key=f"merge_{duplicate['ticket_id']}"):
+                # The screenshot reference and the merge commit together
+                with conn:
+                    image_path = ""
+                    if pending["image_bytes"]:
+                        image_path = store_ticket_image(conn, blob_store, io.BytesIO(pending["image_bytes"]), pending["image_name"])
+                    attached = merge_into_ticket(conn, duplicate["ticket_id"], pending["issue_text"], image_path)
+                st.session_state.pending_ticket = None
+                st.success(f"✅ Merged into ticket #{duplicate['ticket_id']}.")
+                if image_path and not attached:
+                    st.warning(f"Ticket #{duplicate['ticket_id']} already has a screenshot, so yours was not attached; "
+                               "the merged report notes that one was sent.")
+        col1, col2 = st.columns(2)
+        if col1.button("➕ Submit as a new ticket"):
+            save_ticket(conn, blob_store, ocr_workers, pending)
+            st.session_state.pending_ticket = None
+        if col2.button("✖️ Discard"):
+            st.session_state.pending_ticket = None
+            st.rerun()
+
+    # ---------------- Ticket Search ------------------
+    st.divider()
+    st.subheader("🔎 Search Tickets")
+    search_text = st.text_input("Search issue descriptions", placeholder="e.g. insufficient float")
+    if search_text:
+        if st.session_state.get("ticket_search_text") != search_text:
+            st.session_state.ticket_search_text = search_text
+            st.session_state.ticket_search_page = 0
+
+        search_page = st.session_state.ticket_search_page
+        results, has_more = search_tickets(conn, search_text, page=search_page)
+        if results.empty:
+            st.info("No matching tickets.")
+        for row in results.itertuples():
+            st.markdown(f"**#{row.ticket_id}** · {row.issue_tag} · {row.status} · {row.level} · {row.last_updated}  \n{row.snippet}")
+
+        col1, col2, col3 = st.columns([1, 2, 1], vertical_alignment='center')
+        if col1.button("⬅️ Previous", key="search_previous", disabled=search_page == 0):
+            st.session_state.ticket_search_page -= 1
+            st.rerun()
+        col2.caption(f"Results page {search_page + 1}")
+        if col3.button("Next ➡️", key="search_next", disabled=not has_more):
+            st.session_state.ticket_search_page += 1
+            st.rerun()
 
     # ---------------- Ticket Viewer ------------------
     st.divider()
     st.subheader("📋 Submitted Tickets")
-    df = pd.read_sql_query("SELECT * FROM channel_partners_tickets ORDER BY last_updated DESC", conn)
+    col1, col2, col3 = st.columns(3)
+    status_filter = col1.multiselect("Filter by Status", TICKET_STATUSES, default=TICKET_STATUSES,
+                                     help="Clearing every status shows (and exports) no tickets.")
+    level_filter = col2.multiselect("Filter by Level", TICKET_LEVELS, default=TICKET_LEVELS,
+                                    help="Clearing every level shows (and exports) no tickets.")
+    tag_filter = col3.multiselect("Filter by Tag", TICKET_TAGS, help="Leave empty for all tags.")
+    col1, col2 = st.columns(2)
+    date_range = col1.date_input("Created between", value=())
+    page_size = col2.selectbox("Tickets per page", [25, 50, 100])
+
+    filters = {
+        "statuses": status_filter,
+        "levels": level_filter,
+        "tags": tag_filter,
+        "date_from": date_range[0] if len(date_range) > 0 else None,
+        "date_to": date_range[1] if len(date_range) > 1 else None,
+    }
+
+    # Keyset cursors of the pages visited so far; reset whenever the filters change
+    filter_key = (repr(filters), page_size)
+    if st.session_state.get("ticket_filter_key") != filter_key:
+        st.session_state.ticket_filter_key = filter_key
+        st.session_state.ticket_page_cursors = [None]
+
+    cursors = st.session_state.ticket_page_cursors
+    df, next_cursor = fetch_ticket_page(conn, filters, page_size=page_size, after=cursors[-1])
 
     if not df.empty:
-        status_filter = st.multiselect("Filter by Status", df["status"].unique(), default=df["status"].unique())
-        level_filter = st.multiselect("Filter by Level", df["level"].unique(), default=df["level"].unique())
-        filtered_df = df[df["status"].isin(status_filter) & df["level"].isin(level_filter)]
-        st.dataframe(filtered_df)
+        df.insert(0, "preview", df.pop("thumbnail_path").map(cached_thumbnail))
+        st.dataframe(df, column_config={"preview": st.column_config.ImageColumn("Preview")})
+
+        col1, col2, col3 = st.columns([1, 2, 1], vertical_alignment='center')
+        if col1.button("⬅️ Previous", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        col2.caption(f"Page {len(cursors)}")
+        if col3.button("Next ➡️", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
 
         # Escalation block
-        st.subheader("🚀 Escalate a Ticket")
-        ticket_to_escalate = st.selectbox("Select Ticket", filtered_df["ticket_id"].tolist())
-        new_level = st.selectbox("Escalate to", ["L1", "L2"])
-        if st.button("Escalate"):
-            assigned_to = "Shelia" if new_level == "L1" else "Caroline"
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            conn.execute("""
-                UPDATE channel_partners_tickets
-                SET level = ?, assigned_to = ?, status = ?, last_updated = ?
-                WHERE ticket_id = ?
-            """, (new_level, assigned_to, "Escalated", now, ticket_to_escalate))
-            conn.commit()
-            st.success(f"✅ Ticket #{ticket_to_escalate} escalated to {new_level}.")
+        st.subheader("🚀 Escalate Tickets")
+        selected_tickets = st.multiselect("Select Tickets", df["ticket_id"].tolist())
+        col1, col2, col3 = st.columns([1, 1, 1], vertical_alignment='bottom')
+        new_level = col1.selectbox("Escalate to", ["L1", "L2"])
+        if col2.button("Escalate all selected", disabled=not selected_tickets):
+            decisions = escalate_tickets(conn, selected_tickets, new_level)
+            st.success(f"✅ {len(decisions)} ticket(s) escalated to {new_level}.")
+            if len(decisions) < len(selected_tickets):
+                st.info(f"{len(selected_tickets) - len(decisions)} closed ticket(s) were left as they are.")
+            st.dataframe(pd.DataFrame(decisions), hide_index=True)
+        if col3.button("🧭 Auto-route selected", disabled=not selected_tickets):
+            decisions = route_tickets(conn, selected_tickets)
+            st.success(f"✅ Routing rules updated {len(decisions)} of {len(selected_tickets)} ticket(s).")
+            if decisions:
+                st.dataframe(pd.DataFrame(decisions), hide_index=True)
     else:
         st.info("No tickets found.")
 
+    # ---------------- Bulk Import / Export ------------------
+    st.divider()
+    st.subheader("📦 Bulk Import / Export")
+    col1, col2 = st.columns(2)
+    with col1:
+        bulk_file = st.file_uploader("Upload tickets (CSV or JSONL)", type=["csv", "jsonl"])
+        if bulk_file and st.button("📥 Import Tickets"):
+            fmt = "jsonl" if bulk_file.name.endswith(".jsonl") else "csv"
+            progress = st.empty()
+            # utf-8-sig drops the byte-order mark Excel puts at the start of saved CSVs
+            records = iter_ticket_records(io.TextIOWrapper(bulk_file, encoding="utf-8-sig", newline=""), fmt)
+            summary = import_tickets(
+                conn, records,
+                on_progress=lambda s: progress.caption(f"Imported {s['inserted']:,} tickets so far..."),
+            )
+            st.success(
+                f"✅ Imported {summary['inserted']:,} tickets in {summary['seconds']:.1f}s "
+                f"({summary['skipped']:,} duplicates skipped, {summary['rejected']:,} rejected)."
+            )
+            if summary["rejects"]:
+                st.dataframe(pd.DataFrame(summary["rejects"], columns=["line", "reason"]), hide_index=True)
+    with col2:
+        export_format = st.radio("Export format", ["csv", "jsonl"], horizontal=True)
+        st.caption("The download is held in memory while it is served, so very large exports should use "
+                   "`python ticket_io.py export` instead, which streams to a file.")
+        if st.button("📤 Export Filtered Tickets"):
+            # The query is read in chunks and spooled to disk, but st.download_button loads the
+            # spooled file into memory to serve it; only the CLI export never materialises it
+            export_file = tempfile.TemporaryFile(mode="w+", newline="", encoding="utf-8")
+            written = export_tickets(conn, export_file, export_format, filters)
+            export_file.seek(0)
+            st.download_button(
+                f"⬇️ Download {written:,} tickets",
+                data=export_file,
+                file_name=f"tickets_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}",
+            )
+
 
 ticket_view()
@@ -0,0 +1,178 @@
+import re
+import uuid
+from datetime import timedelta
+import pandas as pd
+
+# ---------------- Ticket Constants ------------------
+TICKET_TAGS = ["Float", "SIM Swap", "KYC", "Commission", "Network", "Training", "Other"]
+TICKET_STATUSES = ["Open", "Escalated", "Closed"]
+TICKET_LEVELS = ["L0", "L1", "L2"]
+TICKET_COLUMNS = [
+    "ticket_id", "agent_msisdn", "issue_text", "issue_tag", "status",
+    "level", "assigned_to", "image_path", "created_at", "last_updated",
+]
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+MSISDN_PATTERN = re.compile(r"^(?:\+?254|0)?([17]\d{8})$")
+
+def new_ticket_id():
+    """A fresh ticket id: the first 8 hex digits of a uuid4, as the ticket form has always issued."""
+    return str(uuid.uuid4())[:8]
+
+def normalise_msisdn(value):
+    """Returns a Kenyan MSISDN in 2547XXXXXXXX / 2541XXXXXXXX form, or None if it is not one."""
+    digits = re.sub(r"[\s\-()]", "", str(value or ""))
+    match = MSISDN_PATTERN.match(digits)
+    return f"254{match.group(1)}" if match else None
+
+def msisdn_variants(msisdn):
+    """The stored forms a normalised MSISDN may have; rows written before normalisation keep the raw form."""
+    local = msisdn[3:]
+    return [msisdn, f"+{msisdn}", f"0{local}", local]
+
+# ---------------- Filtered Queries ------------------
+def build_ticket_filters(statuses=None, levels=None, tags=None, date_from=None, date_to=None):
+    """
+    Turns the dashboard filters into a parameterised WHERE clause.
+    A missing (None) filter is skipped. Statuses and levels are selected from a full
+    default, so an explicitly empty list matches nothing, as it did before the
+    filters moved into SQL; an empty tag list means any tag. Dates are inclusive on
+    created_at.
+    """
+    clauses, params = [], []
+    for column, values, empty_matches_all in (
+        ("status", statuses, False), ("level", levels, False), ("issue_tag", tags, True),
+    ):
+        if values:
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        elif values is not None and not empty_matches_all:
+            clauses.append("0")
+    if date_from:
+        clauses.append("created_at >= ?")
+        params.append(date_from.strftime("%Y-%m-%d"))
+    if date_to:
+        clauses.append("created_at < ?")
+        params.append((date_to + timedelta(days=1)).strftime("%Y-%m-%d"))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+def fetch_ticket_page(conn, filters=None, page_size=25, after=None):
+    """
+    Returns one page of tickets, newest first, plus the cursor for the next page.
+
+    Pagination is keyset-based on (last_updated, ticket_id): `after` is the cursor
+    of the previous page, so each page costs the same no matter how deep it is.
+    The returned cursor is None when there are no further pages.
+    """
+    where, params = build_ticket_filters(**(filters or {}))
+    if after is not None:
+        keyset = "(last_updated, ticket_id) < (?, ?)"
+        where = f"{where} AND {keyset}" if where else f"WHERE {keyset}"
+        params.extend(after)
+
+    # Fetch one extra row to know whether a next page exists
+    # Latest screenshot OCR job and image thumbnail per ticket, looked up for the visible page only
+    query = f"""
+        SELECT {', '.join(TICKET_COLUMNS)},
+               (SELECT j.status FROM ticket_ocr_jobs j
+                WHERE j.ticket_id = channel_partners_tickets.ticket_id
+                ORDER BY j.job_id DESC LIMIT 1) AS ocr_status,
+               (SELECT b.thumbnail_path FROM ticket_blobs b
+                WHERE b.path = channel_partners_tickets.image_path) AS thumbnail_path
+        FROM channel_partners_tickets
+        {where}
+        ORDER BY last_updated DESC, ticket_id DESC
+        LIMIT ?
+    """
+    df = pd.read_sql_query(query, conn, params=params + [page_size + 1])
+
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last = df.iloc[-1]
+        next_cursor = (last["last_updated"], last["ticket_id"])
+    return df, next_cursor
+
+# ---------------- Maintained Statistics ------------------
+# One row per (status, level, issue_tag, assigned_to) combination, kept in step with
+# channel_partners_tickets by triggers so counters update in the writer's transaction.
+STATS_GROUP_COLUMNS = ["status", "level", "issue_tag", "assigned_to"]
+
+def _stats_upsert(prefix, delta):
+    values = ", ".join(f"COALESCE({prefix}.{column}, '')" for column in STATS_GROUP_COLUMNS)
+    return f"""
+        INSERT INTO channel_partners_ticket_stats ({', '.join(STATS_GROUP_COLUMNS)}, ticket_count)
+        VALUES ({values}, {delta})
+        ON CONFLICT ({', '.join(STATS_GROUP_COLUMNS)})
+        DO UPDATE SET ticket_count = ticket_count + ({delta});
+    """
+
+def create_ticket_stats(conn):
+    """
+    (Re)creates the ticket summary table and its triggers and backfills it from the
+    tickets table. Statements run on the caller's transaction; see migrations.py.
+    """
+    columns = ", ".join(STATS_GROUP_COLUMNS)
+    statements = [
+        "DROP TRIGGER IF EXISTS channel_partners_ticket_stats_insert",
+        "DROP TRIGGER IF EXISTS channel_partners_ticket_stats_delete",
+        "DROP TRIGGER IF EXISTS channel_partners_ticket_stats_update",
+        "DROP TABLE IF EXISTS channel_partners_ticket_stats",
+        f"""
+        CREATE TABLE channel_partners_ticket_stats (
+            status TEXT NOT NULL,
+            level TEXT NOT NULL,
+            issue_tag TEXT NOT NULL,
+            assigned_to TEXT NOT NULL,
+            ticket_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY ({columns})
+        ) WITHOUT ROWID
+        """,
+        f"""
+        CREATE TRIGGER channel_partners_ticket_stats_insert
+        AFTER INSERT ON channel_partners_tickets
+        BEGIN {_stats_upsert("NEW", 1)} END
+        """,
+        f"""
+        CREATE TRIGGER channel_partners_ticket_stats_delete
+        AFTER DELETE ON channel_partners_tickets
+        BEGIN {_stats_upsert("OLD", -1)} END
+        """,
+        f"""
+        CREATE TRIGGER channel_partners_ticket_stats_update
+        AFTER UPDATE OF {columns} ON channel_partners_tickets
+        BEGIN {_stats_upsert("OLD", -1)} {_stats_upsert("NEW", 1)} END
+        """,
+        f"""
+        INSERT INTO channel_partners_ticket_stats ({columns}, ticket_count)
+        SELECT {', '.join(f"COALESCE({column}, '')" for column in STATS_GROUP_COLUMNS)}, COUNT(*)
+        FROM channel_partners_tickets
+        GROUP BY 1, 2, 3, 4
+        """,
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+def ticket_counts(conn):
+    """Returns the created / resolved / pending counters for the dashboard header."""
+    total, resolved = conn.execute("""
+        SELECT COALESCE(SUM(ticket_count), 0),
+               COALESCE(SUM(CASE WHEN status = 'Closed' THEN ticket_count ELSE 0 END), 0)
+        FROM channel_partners_ticket_stats
+    """).fetchone()
+    return {"total": total, "resolved": resolved, "pending": total - resolved}
+
+def ticket_breakdown(conn, column):
+    """Returns open / closed ticket counts grouped by a summary column, e.g. issue_tag or assigned_to."""
+    if column not in STATS_GROUP_COLUMNS:
+        raise ValueError(f"Cannot break tickets down by {column!r}")
+    return pd.read_sql_query(f"""
+        SELECT {column},
+               SUM(CASE WHEN status != 'Closed' THEN ticket_count ELSE 0 END) AS pending,
+               SUM(CASE WHEN status = 'Closed' THEN ticket_count ELSE 0 END) AS resolved,
+               SUM(ticket_count) AS total
+        FROM channel_partners_ticket_stats
+        GROUP BY {column}
+        HAVING SUM(ticket_count) > 0
+        ORDER BY total DESC
+    """, conn)